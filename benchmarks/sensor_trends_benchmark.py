@@ -0,0 +1,80 @@
+"""
+Latency of /sensor-trends scoring as the hourly history grows.
+
+Builds synthetic hourly readings for a number of postal codes, then appends
+one hour at a time and times the whole append path: folding the new rows
+into the regional rollups plus the incremental SensorTrends update. It is
+compared against the same fold followed by rescoring the entire hourly
+history (not capped by TREND_RETENTION). The append path should stay flat as
+the history grows while the full rescore grows with it.
+
+    python -m benchmarks.sensor_trends_benchmark
+"""
+
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+
+from utils.regional_rollups import RegionalRollups
+from utils.sensor_trends import SensorTrends, score_series
+
+POSTAL_CODES = [f"{10000 + i}" for i in range(20)]
+HISTORY_DAYS = [30, 180, 365, 730]
+APPENDS = 20
+
+
+def synthetic_rows(start: datetime, hours: int, seed: int) -> pl.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = hours * len(POSTAL_CODES)
+    timestamps = [start + timedelta(hours=h, minutes=7) for h in range(hours)]
+    return pl.DataFrame(
+        {
+            "timestamp": np.repeat(np.array(timestamps, dtype="datetime64[us]"), len(POSTAL_CODES)),
+            "device_id": [f"dev-{i % 50}" for i in range(n)],
+            "country": ["US"] * n,
+            "state": ["NY"] * n,
+            "postal_code": POSTAL_CODES * hours,
+            "temp": rng.normal(20, 5, n),
+            "humidity": rng.normal(50, 10, n),
+            "pressure": rng.normal(1000, 3, n),
+        }
+    )
+
+
+def run(days: int):
+    start = datetime(2020, 1, 1)
+    rollups = RegionalRollups(snapshot=None)
+    rollups.ingest(synthetic_rows(start, days * 24, seed=days), version=0)
+
+    trends = SensorTrends(rollups)
+    trends.trends("humidity", state="NY", window="30d")  # warm the cache
+
+    append, full = [], []
+    next_hour = start + timedelta(days=days)
+    for i in range(APPENDS):
+        rows = synthetic_rows(next_hour, 1, seed=i)
+        next_hour += timedelta(hours=1)
+
+        began = time.perf_counter()
+        rollups.ingest(rows, version=i + 1)
+        fold = time.perf_counter() - began
+        trends.trends("humidity", state="NY", window="30d")
+        append.append(time.perf_counter() - began)
+
+        # same fold, then the whole hourly history scored again
+        began = time.perf_counter()
+        scored = score_series(rollups.hourly_series("humidity", state="NY"), "30d")
+        scored.filter(pl.col("bucket") > scored["bucket"].max() - timedelta(days=7))
+        full.append(fold + time.perf_counter() - began)
+
+    return statistics.median(append) * 1000, statistics.median(full) * 1000
+
+
+if __name__ == "__main__":
+    print(f"{'history':>10} {'append ms':>12} {'full rescore ms':>16}")
+    for days in HISTORY_DAYS:
+        append_ms, full_ms = run(days)
+        print(f"{days:>9}d {append_ms:>12.2f} {full_ms:>16.2f}")
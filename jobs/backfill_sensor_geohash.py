@@ -0,0 +1,54 @@
+"""
+Backfill sensor_data_by_geohash from the sensor Delta table.
+
+Reads the valid readings of the Delta data files (optionally only those
+overlapping --start-date / --end-date) a few files at a time and writes each
+row under its geohash prefix / day partition with concurrent prepared inserts.
+Row ids are derived from (device_id, timestamp), so ranges can be re-run.
+New versions are upserted by the delta tailer as they land
+(utils/geohash_sync.py); this job fills in history and gaps.
+
+    python -m jobs.backfill_sensor_geohash [--start-date 2025-01-01] [--end-date 2025-02-01]
+"""
+
+import argparse
+import time
+from datetime import date
+
+from utils.cassandra_session import shutdown_cassandra
+from utils.geohash_sync import write_geohash_rows
+from utils.sensor_file_index import read_sensor_range
+
+# data files read per batch of inserts
+FILES_PER_BATCH = 8
+
+
+def backfill(start_date=None, end_date=None, concurrency=64):
+    """Copy readings with start_date <= timestamp < end_date, all of them by default."""
+    # only the files / row groups in range are read, the snapshot isn't loaded
+    written = 0
+    failed = 0
+    started = time.monotonic()
+    for files_read, files_total, table in read_sensor_range(
+        start_date, end_date, files_per_batch=FILES_PER_BATCH
+    ):
+        batch_written, batch_failed = write_geohash_rows(table, concurrency)
+        written += batch_written
+        failed += batch_failed
+        print(
+            f"{files_read}/{files_total} files, "
+            f"written {written} rows, {failed} failed ({time.monotonic() - started:.1f}s)"
+        )
+    return written, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--start-date", type=date.fromisoformat, default=None)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+    try:
+        backfill(args.start_date, args.end_date, args.concurrency)
+    finally:
+        shutdown_cassandra()
@@ -1,13 +1,45 @@
 from fastapi import FastAPI
 from routers import items
-from routers import chatagent, client_api, dashboard, auth
+from routers import chatagent, client_api, dashboard, auth, metrics
 from routers.client_apis.authorize_login import router as authorize_login_router
 from routers.client_apis_clickhouse.fetch_sensor_data import router as fetch_sensor_data
 from fastapi.middleware.cors import CORSMiddleware
 from langchain_core.prompts import ChatPromptTemplate
-import duckdb
+from contextlib import asynccontextmanager
+from utils.duckdb_pool import close_duckdb_pool, init_duckdb_pool
+from utils.executor import shutdown_executor
+from utils.delta_tailer import start_delta_tailer, stop_delta_tailer
+from utils.cassandra_session import init_cassandra, shutdown_cassandra
+from utils.auth import close_auth_client
+from utils.clickhouse_buckets import close_clickhouse_client
+import logging
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # shared DuckDB database: extensions + S3 secret loaded once for all requests;
+    # if INSTALL fails now, DuckDB requests retry the setup lazily
+    try:
+        init_duckdb_pool()
+    except Exception as e:
+        logging.error(f"duckdb unavailable at startup: {e}")
+    # shared Cassandra cluster/session; requests reconnect lazily if it's down now
+    try:
+        init_cassandra()
+    except Exception as e:
+        logging.error(f"cassandra unavailable at startup: {e}")
+    # keep the sensor snapshot, rollups and file index caught up with the delta log
+    start_delta_tailer()
+    yield
+    await stop_delta_tailer()
+    await close_auth_client()
+    shutdown_executor()
+    shutdown_cassandra()
+    close_clickhouse_client()
+    close_duckdb_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(items.router)
 app.include_router(chatagent.router)
 app.include_router(client_api.router)
@@ -15,6 +47,7 @@ app.include_router(authorize_login_router, prefix="/api/client")
 app.include_router(fetch_sensor_data, prefix="/api/client")
 app.include_router(auth.router, prefix="/auth")
 app.include_router(dashboard.router, prefix="/dashboard")
+app.include_router(metrics.router, prefix="/metrics")
 
 app.add_middleware(
     CORSMiddleware,
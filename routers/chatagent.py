@@ -5,7 +5,9 @@ from pydantic import BaseModel
 import logging
 import os
 from langchain_core.prompts import ChatPromptTemplate
-import duckdb
+from utils.delta_snapshot import get_sensor_snapshot
+from utils.duckdb_pool import duckdb_cursor, sandboxed_query
+from utils.singleflight import run_blocking_once
 
 router = APIRouter()
 
@@ -48,7 +50,7 @@ async def query_llm():
         )
         # print(request)
 
-        actual_schema = fetch_table_schema()
+        actual_schema = await run_blocking_once("duckdb", fetch_table_schema)
         # Generate SQL query using OpenAI LLM
         sql_prompt = ChatPromptTemplate.from_template(
             """
@@ -116,29 +118,23 @@ async def query_llm():
 
         sql_chain = sql_prompt | llm
         sql_query = (
-            sql_chain.invoke({"query": request.query, "schema": actual_schema})
-            .content.strip()
+            (
+                await sql_chain.ainvoke(
+                    {"query": request.query, "schema": actual_schema}
+                )
+            ).content.strip()
             .rstrip(";")
         )
         print("print the sql_query:", sql_query)
 
-        corrected_query = sql_query.replace(
-            "FROM sensor_data",
-            f"FROM delta_scan('{read_paths_dev['datasnake_sensor_data_processed_deltalake']}')",
-        )
+        # `sensor_data` is registered in the sandbox, no path rewriting needed
+        corrected_query = sql_query
 
         print(f"Generating Corrected SQL: {corrected_query}")
         # above corrected_query is not being used here though
         # check /query-prompt-dataset for it to be in action
 
         # Execute SQL query
-        con = duckdb.connect()
-        duckdb.sql(
-            """
-            INSTALL delta;
-            LOAD delta;
-            """
-        )
         # query = f"""
         # SELECT *
         # FROM delta_scan('{read_paths_dev['datasnake_sensor_data_processed_deltalake']}')
@@ -225,8 +221,7 @@ async def query_llm():
         WHERE postal_code != 000000 
         """
         print("debugging query:", debug_query)
-        result_df = con.query(corrected_query).pl()
-        con.close()
+        result_df = await run_blocking_once("duckdb", run_generated_sql, corrected_query)
         print(result_df.head())
         # columns = [desc[0] for desc in con.description]
         # print()
@@ -235,7 +230,7 @@ async def query_llm():
         # print(result_data)
         # Summarize results
         summary_prompt = f"Analyze this data and summarize key insights: {result_data}"
-        summary = llm.invoke(summary_prompt)
+        summary = await llm.ainvoke(summary_prompt)
 
         return {
             "query": request.query,
@@ -248,15 +243,24 @@ async def query_llm():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def run_generated_sql(sql):
+    """
+    Run LLM generated SQL against the in-memory sensor snapshot.
+
+    The SQL is untrusted (prompt injection), so it never touches the shared
+    DuckDB database holding the S3 secret: it runs in a locked-down sandbox
+    connection that only sees `sensor_data`.
+    """
+    return sandboxed_query(sql, {"sensor_data": get_sensor_snapshot()})
+
+
 def fetch_table_schema():
     """Retrieve the table schema dynamically from DeltaLake via DuckDB."""
-    con = duckdb.connect()
-    duckdb.sql("INSTALL delta; LOAD delta;")  # Load Delta extension
     DELTA_TABLE_PATH = "datasnake_sensor_data_processed_deltalake"
     # Fetch schema
     schema_query = f"DESCRIBE SELECT * FROM delta_scan('{read_paths_dev['datasnake_sensor_data_processed_deltalake']}') LIMIT 1;"
-    schema_df = con.query(schema_query).pl()
-    con.close()
+    with duckdb_cursor() as con:
+        schema_df = con.query(schema_query).pl()
 
     # Extract column names and types
     schema = [
@@ -275,7 +279,7 @@ async def summarize_query_llm():
         # print(request)
 
         # Get actual table schema from DeltaLake
-        actual_schema = fetch_table_schema()
+        actual_schema = await run_blocking_once("duckdb", fetch_table_schema)
         print(f"🟢 Retrieved Schema:\n{actual_schema}")
 
         # Generate SQL query from OpenAI LLM natural language
@@ -293,24 +297,14 @@ async def summarize_query_llm():
         )
 
         sql_chain = sql_prompt | llm
-        sql_query = sql_chain.invoke({"query": request.query}).content
-        corrected_query = sql_query.replace(
-            " FROM sensor_data",
-            f" FROM delta_scan('{read_paths_dev['datasnake_sensor_data_processed_deltalake']}')",
-        )
+        sql_query = (await sql_chain.ainvoke({"query": request.query})).content
+        # `sensor_data` is registered in the sandbox, no path rewriting needed
+        corrected_query = sql_query
         print(f"Generated Corrected SQL: {corrected_query}")
 
         # Execute SQL query
-        con = duckdb.connect()
-        duckdb.sql(
-            """
-            INSTALL delta;
-            LOAD delta;
-            """
-        )
 
-        result_df = con.query(corrected_query).pl()
-        con.close()
+        result_df = await run_blocking_once("duckdb", run_generated_sql, corrected_query)
         print(result_df.head())
         # columns = [desc[0] for desc in con.description]
         # print()
@@ -321,7 +315,7 @@ async def summarize_query_llm():
         # summary_prompt = f"Analyze this data and summarize key insights: {result_data}"
         summary_prompt = f"Analyze this SQL query result and explain the insights in a human-friendly way: {result_data}"
 
-        summary = llm.invoke(summary_prompt)
+        summary = await llm.ainvoke(summary_prompt)
 
         return {
             "query": request.query,
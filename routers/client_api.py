@@ -1,18 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
 from pydantic import BaseModel
+from utils.auth import CLOUDFLARE_WORKER_URL_LOGIN, AuthRequest, is_authenticated
 from utils.security import decode_access_token
 from fastapi.security import OAuth2PasswordBearer
 from utils.security import verify_token
-from cassandra.cluster import Cluster
-from cassandra.auth import PlainTextAuthProvider
+import asyncio
 import httpx
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import os
 import sqlite3
 import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal, Optional
+from utils import cassandra_async, geohash
+from utils.cassandra_session import COLUMNAR_PROFILE
+from utils.cassandra_async import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_arrow_page
+from utils.singleflight import flight_key
+from utils.executor import run_blocking
+from utils.regional_rollups import naive_utc, regional_rollups
+from utils.sensor_trends import parse_window, sensor_trends
+from utils.responses import frame_response, frames_response
+from utils.sensor_locations import sensor_locations
+from utils.sensor_file_index import sensor_file_index
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
-cassandra_user = ""
-cassandra_password = ""
 
 # def get_current_user(authorization: str = Header(None)):
 #     if not authorization or not authorization.startswith("Bearer "):
@@ -31,39 +45,16 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     return verify_token(token)
 
 
-# Initialize Cassandra connection
-def get_cassandra_session():
-    auth_provider = PlainTextAuthProvider(
-        cassandra_user, cassandra_password
-    )  # Update credentials
-    cluster = Cluster(
-        ["127.0.0.1"], auth_provider=auth_provider
-    )  # Update with actual IP
-    session = cluster.connect()
-    session.set_keyspace("datasnake")
-    return session
-
-
 @router.get("/api/client/data")
 def get_client_data(username: str = Depends(get_current_user)):
     return {"message": f"Hello {username}, here is your data!"}
 
 
-CLOUDFLARE_WORKER_URL_LOGIN = (
-    "https://d1-worker-production.rustchain64.workers.dev/api/login"
-)
-
 CLOUDFLARE_WORKER_URL_GET_USERS = (
     "https://d1-worker-production.rustchain64.workers.dev/api/users"
 )
 
 
-# Request Model
-class AuthRequest(BaseModel):
-    username: str
-    password: str
-
-
 # $ curl -X POST http://localhost:8000/api/cloudflare-login   -H "Content-Type: application/json"   -d '{"username": "prabhakar_10sharma", "password": "psPS_datasnake"}'
 @router.post("/api/cloudflare-login")
 async def login(auth_data: AuthRequest):
@@ -94,30 +85,6 @@ async def login(auth_data: AuthRequest):
     }
 
 
-async def is_authenticated(request: AuthRequest):
-    print("inside is_authenticated:", request)
-    logging.info(f"inside cloudflare login auth: {request}")
-    print(f"inside cloudflare login auth: {request}")
-    async with httpx.AsyncClient() as client:
-        print("going to call client")
-        response = await client.post(CLOUDFLARE_WORKER_URL_LOGIN, json=request.dict())
-        print("after calling client", response.json())
-
-    if response.status_code != 200:
-        print("did i get here !200 response???")
-        logging.info("did i get here !200 response???")
-        raise HTTPException(
-            status_code=response.status_code, detail="Authentication failed"
-        )
-
-    logging.info(f"status code - {response.status_code}")
-    print("status code: ", response.status_code)
-    return {
-        "status": response.status_code,
-        "username": response.json().get("user").get("username"),
-    }
-
-
 async def check_auth(request: Request):
     """Checks if the request has a valid JWT token from Cloudflare login."""
     auth_header = request.headers.get("Authorization")
@@ -162,35 +129,64 @@ async def get_users():
     # return response.json()
 
 
+SENSOR_DATA_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_processed
+"""
+SENSOR_DATA_BY_LAT_LON_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_by_lat_lon
+WHERE lat = ? AND lon = ?
+"""
+SENSOR_DATA_BY_GEOHASH_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_by_geohash
+WHERE geohash_prefix = ? AND day = ? AND geohash >= ? AND geohash < ?
+"""
+
+DEVICE_DAY_HISTORY_CQL = """
+SELECT timestamp, lat, lon, temp, humidity, pressure, country, state, city, postal_code
+FROM sensor_data_by_device_day
+WHERE device_id = ? AND day = ?
+"""
+
+PAGE_SIZE_QUERY = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+CURSOR_QUERY = Query(None, description="next_cursor from the previous page")
+
+# max geohash cells (clustering range reads) per day of a bounding-box query
+GEOHASH_MAX_CELLS = int(os.getenv("GEOHASH_MAX_CELLS", "64"))
+# max days (= partitions per cell) a bounding-box query may walk back
+GEOHASH_MAX_DAYS = int(os.getenv("GEOHASH_MAX_DAYS", "31"))
+# rows per page when scanning one geohash partition
+GEOHASH_FETCH_SIZE = int(os.getenv("GEOHASH_FETCH_SIZE", "500"))
+# max days (= partitions) one device history request may read
+DEVICE_HISTORY_MAX_DAYS = int(os.getenv("DEVICE_HISTORY_MAX_DAYS", "31"))
+
+
 # curl -X GET http://localhost:8000/api/client/sensor-data \
 #      -H "Authorization: Bearer YOUR_JWT_TOKEN"
 @router.get("/api/client/sensor-data")
-def get_sensor_data(auth_response: dict = Depends(is_authenticated)):
+async def get_sensor_data(
+    request: Request,
+    page_size: int = PAGE_SIZE_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    auth_response: dict = Depends(is_authenticated),
+):
     try:
         # print(f"data returned from is_authenticated: {auth_response}")
         # logging.info(f"data returned from is_authenticated: {auth_response}")
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_processed 
-        LIMIT 5
-        """
-        rows = session.execute(query)
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        return {"sensor_data": data}
+        rows, next_cursor = await fetch_arrow_page(
+            SENSOR_DATA_CQL,
+            None,
+            flight_key("sensor-data"),
+            page_size,
+            cursor,
+        )
+
+        return frame_response(request, rows, "sensor_data", next_cursor=next_cursor)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -198,83 +194,236 @@ def get_sensor_data(auth_response: dict = Depends(is_authenticated)):
 # request=>lat/lon ( with no time duration )
 # response ( past month )
 @router.get("/api/client/sensor-data-by-lat-lon")
-def get_sensor_data(
-    lat: str, lon: str, auth_response: dict = Depends(is_authenticated)
+async def get_sensor_data(
+    request: Request,
+    lat: float,
+    lon: float,
+    page_size: int = PAGE_SIZE_QUERY,
+    cursor: Optional[str] = CURSOR_QUERY,
+    auth_response: dict = Depends(is_authenticated),
 ):
     try:
         # print(f"data returned from is_authenticated: {auth_response}")
         # logging.info(f"data returned from is_authenticated: {auth_response}")
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_processed 
-        WHERE lat = %s and lon = %s
-        LIMIT 5
-        """
-        rows = session.execute(query)
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        if not data:
+        rows, next_cursor = await fetch_arrow_page(
+            SENSOR_DATA_BY_LAT_LON_CQL,
+            (lat, lon),
+            flight_key("sensor-data-by-lat-lon", lat=lat, lon=lon),
+            page_size,
+            cursor,
+        )
+
+        if rows.num_rows == 0 and cursor is None:
             raise HTTPException(
                 status_code=404,
                 detail="No sensor data found for the given coordinates.",
             )
 
-        return {"sensor_data": data}
+        return frame_response(request, rows, "sensor_data", next_cursor=next_cursor)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# sensors are looked up in the in-memory location index, then only the
+# nearest one's sensor_data_by_lat_lon partition is read; next_cursor pages
+# on through /api/client/sensor-data-by-lat-lon with that sensor's lat/lon
+@router.get("/api/client/sensor-data-nearest")
+async def get_sensor_data_nearest(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=100),
+    max_km: Optional[float] = Query(None, gt=0),
+    page_size: int = PAGE_SIZE_QUERY,
+    auth_response: dict = Depends(is_authenticated),
+):
+    try:
+        sensors = await run_blocking("delta", sensor_locations.nearest, lat, lon, k, max_km)
+        if sensors.height == 0:
+            raise HTTPException(
+                status_code=404, detail="No sensor found near the given coordinates."
+            )
+
+        nearest_lat, nearest_lon = sensors["lat"][0], sensors["lon"][0]
+        rows, next_cursor = await fetch_arrow_page(
+            SENSOR_DATA_BY_LAT_LON_CQL,
+            (nearest_lat, nearest_lon),
+            flight_key("sensor-data-by-lat-lon", lat=nearest_lat, lon=nearest_lon),
+            page_size,
+        )
+
+        return frames_response(
+            {"sensors": sensors, "sensor_data": pl.from_arrow(rows)},
+            next_cursor=next_cursor,
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# GET /api/client/device-history?device_id=d1&start_date=2025-04-01&end_date=2025-04-07
+@router.get("/api/client/device-history")
+async def get_device_history(
+    request: Request,
+    device_id: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    auth_response: dict = Depends(is_authenticated),
+):
+    """
+    Readings of one device in [start_date, end_date], oldest first.
+
+    Each day is its own sensor_data_by_device_day partition: all of them are
+    read concurrently and concatenated in day order. Defaults to the last 7
+    days of data.
+    """
+    if end_date is None:
+        end_date = await run_blocking("delta", sensor_file_index.latest_date) or date.today()
+    start_date = start_date or end_date - timedelta(days=6)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+    days = (end_date - start_date).days + 1
+    if days > DEVICE_HISTORY_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {DEVICE_HISTORY_MAX_DAYS} days per request, got {days}",
+        )
+
+    try:
+        query = await cassandra_async.prepare(DEVICE_DAY_HISTORY_CQL)
+        day_tables = await asyncio.gather(
+            *[
+                cassandra_async.execute_arrow(query, (device_id, start_date + timedelta(days=i)))
+                for i in range(days)
+            ]
+        )
+        history = pa.concat_tables(day_tables, promote_options="default")
+
+        if history.num_rows == 0:
+            raise HTTPException(
+                status_code=404, detail="No sensor data found for the given device."
+            )
+
+        return frame_response(
+            request,
+            history,
+            "sensor_data",
+            device_id=device_id,
+            start_date=str(start_date),
+            end_date=str(end_date),
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _read_geohash_cell(statement, cell, day, min_lat, min_lon, max_lat, max_lon, limit):
+    """Arrow pages of one geohash cell on `day` inside the box, about `limit` rows."""
+    low, high = geohash.prefix_range(cell)
+    pager = await cassandra_async.execute_paged(
+        statement,
+        (cell[: geohash.GEOHASH_PARTITION_PRECISION], day, low, high),
+        fetch_size=GEOHASH_FETCH_SIZE,
+        execution_profile=COLUMNAR_PROFILE,
+    )
+    inside = (
+        (pc.field("lat") >= min_lat)
+        & (pc.field("lat") <= max_lat)
+        & (pc.field("lon") >= min_lon)
+        & (pc.field("lon") <= max_lon)
+    )
+    tables = []
+    found = 0
+    async for page in pager.pages():
+        if page.num_rows == 0:
+            continue
+        page = page.filter(inside)
+        tables.append(page)
+        found += page.num_rows
+        if found >= limit:
+            break
+    return tables
+
+
+# the box is covered with geohash cells, as fine as GEOHASH_MAX_CELLS allows,
+# and every cell is a clustering range read in its prefix / day partition.
+# Days are read newest first until `limit` rows are found.
 @router.get("/api/client/sensor-data-by-lat-lon-range")
-def get_sensor_data_by_range(
-    min_lat: str,
-    max_lat: str,
-    min_lon: str,
-    max_lon: str,
+async def get_sensor_data_by_range(
+    request: Request,
+    min_lat: float = Query(..., ge=-90, le=90),
+    max_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lon: float = Query(..., ge=-180, le=180),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=1000),
     auth_response: dict = Depends(is_authenticated),
 ):
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(
+            status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon"
+        )
+    cells = geohash.cover_size(min_lat, min_lon, max_lat, max_lon)
+    if cells > GEOHASH_MAX_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bounding box spans {cells} geohash cells, at most {GEOHASH_MAX_CELLS} allowed",
+        )
+    end_date = end_date or datetime.now(timezone.utc).date()
+    start_date = start_date or end_date - timedelta(days=6)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+    days = (end_date - start_date).days + 1
+    if days > GEOHASH_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {GEOHASH_MAX_DAYS} days per request, got {days}",
+        )
+
     try:
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_processed 
-        WHERE lat >= %s AND lat <= %s 
-        AND lon >= %s AND lon <= %s 
-        LIMIT 10
-        """
-        rows = session.execute(query, (min_lat, max_lat, min_lon, max_lon))
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        if not data:
+        statement = await cassandra_async.prepare(SENSOR_DATA_BY_GEOHASH_CQL)
+        precision = geohash.cover_precision(
+            min_lat, min_lon, max_lat, max_lon, GEOHASH_MAX_CELLS
+        )
+        box_cells = geohash.cover(min_lat, min_lon, max_lat, max_lon, precision)
+        tables = []
+        found = 0
+        day = end_date
+        while day >= start_date and found < limit:
+            cell_rows = await asyncio.gather(
+                *[
+                    _read_geohash_cell(
+                        statement, cell, day, min_lat, min_lon, max_lat, max_lon, limit - found
+                    )
+                    for cell in box_cells
+                ]
+            )
+            for table in (table for cell in cell_rows for table in cell):
+                tables.append(table)
+                found += table.num_rows
+            day -= timedelta(days=1)
+        rows = (
+            pa.concat_tables(tables, promote_options="default").slice(0, limit)
+            if tables
+            else None
+        )
+
+        if rows is None or rows.num_rows == 0:
             raise HTTPException(
                 status_code=404, detail="No sensor data found in the given range."
             )
 
-        return {"sensor_data": data}
+        return frame_response(request, rows, "sensor_data")
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -316,21 +465,139 @@ def get_sensor_data_by_range(
 
 # GET /sensor-averages
 # GET /sensor-averages?country=US&state=CA&aggregation=daily
-# Logic:
-# Compute mean values for temperature, humidity, etc., using Polars for efficient aggregation.
-# If aggregation is provided, return averages at that granularity.
-# If no date range is provided, return last 7 days of data by default.
+@router.get("/sensor-averages")
+async def get_sensor_averages(
+    request: Request,
+    country: Optional[str] = None,
+    state: Optional[str] = None,
+    postal_code: Optional[str] = None,
+    aggregation: Literal["daily", "monthly", "total"] = "daily",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    auth_response: dict = Depends(is_authenticated),
+):
+    """
+    Mean temperature, humidity and pressure for a region, per day / month or in total.
+
+    Served from the per-region daily / monthly partial aggregates, so long
+    ranges read a handful of partials instead of raw readings. Without a
+    date range the last 7 days of data are returned.
+    """
+    if start_date is not None and end_date is not None and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+    try:
+        averages = await run_blocking(
+            "delta",
+            regional_rollups.averages,
+            country,
+            state,
+            postal_code,
+            aggregation,
+            start_date,
+            end_date,
+        )
+        return frame_response(
+            request,
+            averages,
+            "sensor_averages",
+            aggregation=aggregation,
+            region={"country": country, "state": state, "postal_code": postal_code},
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 # GET /sensor-extremes
 # GET /sensor-extremes?postal_code=94103&metric=temperature
-# Logic:
-# Find max/min values within the given range for the specified metric.
-# Optimize queries with Cassandra’s partition key strategy.
+# query metric name -> sensor column
+EXTREME_METRICS = {"temperature": "temp", "temp": "temp", "humidity": "humidity", "pressure": "pressure"}
+
+
+@router.get("/sensor-extremes")
+async def get_sensor_extremes(
+    metric: Literal["temperature", "temp", "humidity", "pressure"] = "temperature",
+    country: Optional[str] = None,
+    state: Optional[str] = None,
+    postal_code: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    auth_response: dict = Depends(is_authenticated),
+):
+    """
+    Min and max of a metric for a region, with the timestamp and device that recorded them.
+
+    Combined from the month / day / hour min-max summaries covering the range
+    (hour resolution), never from raw readings. Defaults to the last 7 days.
+    Bounds with an offset (e.g. `2025-01-01T00:00:00Z`) are taken as UTC.
+    """
+    start, end = naive_utc(start), naive_utc(end)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    try:
+        return await run_blocking(
+            "delta",
+            regional_rollups.extremes,
+            EXTREME_METRICS[metric],
+            country,
+            state,
+            postal_code,
+            start,
+            end,
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 # GET /sensor-trends
 # GET /sensor-trends?state=NY&metric=humidity&window=30d
-# Logic:
-# Use moving averages or anomaly detection (Z-score, seasonal decomposition) to highlight trends.
-# This helps detect heatwaves, cold snaps, or humidity spikes.
+def _sensor_trends(metric, country, state, postal_code, window, days, threshold):
+    regional_rollups.refresh()
+    return sensor_trends.trends(
+        metric, country, state, postal_code, window=window, days=days, threshold=threshold
+    )
+
+
+@router.get("/sensor-trends")
+async def get_sensor_trends(
+    request: Request,
+    metric: Literal["temperature", "temp", "humidity", "pressure"] = "temperature",
+    country: Optional[str] = None,
+    state: Optional[str] = None,
+    postal_code: Optional[str] = None,
+    window: str = Query(
+        "30d", pattern=r"^[1-9]\d*[hd]$", description="Rolling window, e.g. 30d or 12h, at most 90d"
+    ),
+    days: int = Query(7, ge=1, le=90, description="How many recent days to return"),
+    threshold: float = Query(3.0, gt=0, description="|Z-score| flagged as an anomaly"),
+    auth_response: dict = Depends(is_authenticated),
+):
+    """
+    Hourly series with rolling mean / std over `window` and Z-score anomalies.
+
+    Highlights heatwaves, cold snaps or humidity spikes. Scored series are
+    cached and only the new hours are rescored when data arrives.
+    """
+    try:
+        parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        trends = await run_blocking(
+            "polars",
+            _sensor_trends,
+            EXTREME_METRICS[metric],
+            country,
+            state,
+            postal_code,
+            window,
+            days,
+            threshold,
+        )
+        return frame_response(
+            request, trends, "sensor_trends", metric=metric, window=window, threshold=threshold
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
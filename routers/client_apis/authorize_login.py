@@ -1,10 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from utils.security import decode_access_token
-from fastapi.security import OAuth2PasswordBearer
-from utils.security import verify_token
-from cassandra.cluster import Cluster
-from cassandra.auth import PlainTextAuthProvider
 import httpx
 import logging
 
@@ -1,75 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
-from pydantic import BaseModel
-from utils.cassandra_session import get_cassandra_session
-import httpx
-import sqlite3
-import logging
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+from utils.auth import AuthRequest, is_authenticated
+from typing import Optional
+from utils.cassandra_async import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_arrow_page
+from utils.responses import frame_response
+from utils.singleflight import flight_key
 
 router = APIRouter()
 
 
-class AuthRequest(BaseModel):
-    username: str
-    password: str
-
 
-CLOUDFLARE_WORKER_URL_LOGIN = (
-    "https://d1-worker-production.rustchain64.workers.dev/api/login"
-)
+CURRENT_SENSOR_DATA_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_processed
+"""
+SENSOR_DATA_BY_LAT_LON_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_by_lat_lon
+WHERE lat = ? AND lon = ?
+"""
+SENSOR_DATA_BY_COUNTRY_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_processed
+WHERE country = ?
+"""
 
 
-async def is_authenticated(request: AuthRequest):
-    print("inside is_authenticated:", request)
-    logging.info(f"inside cloudflare login auth: {request}")
-    print(f"inside cloudflare login auth: {request}")
-    async with httpx.AsyncClient() as client:
-        print("going to call client")
-        response = await client.post(CLOUDFLARE_WORKER_URL_LOGIN, json=request.dict())
-        print("after calling client", response.json())
-
-    if response.status_code != 200:
-        print("did i get here !200 response???")
-        logging.info("did i get here !200 response???")
-        raise HTTPException(
-            status_code=response.status_code, detail="Authentication failed"
-        )
-
-    logging.info(f"status code - {response.status_code}")
-    print("status code: ", response.status_code)
-    return {
-        "status": response.status_code,
-        "username": response.json().get("user").get("username"),
-    }
+class SensorDataPage(BaseModel):
+    username: str
+    password: str
+    page_size: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
 
 
 @router.post("/current-sensor-data-cassandra")
-async def get_sensor_data(auth_data: AuthRequest):
+async def get_sensor_data(auth_data: SensorDataPage, request: Request):
     try:
         print("inside api client get sensor data :")
         print("inside api client get sensor data :", auth_data)
-        response = await is_authenticated(auth_data)
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_processed 
-        LIMIT 5
-        """
-        rows = session.execute(query)
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        return {"sensor_data": data}
+        credentials = {"username": auth_data.username, "password": auth_data.password}
+        response = await is_authenticated(AuthRequest(**credentials))
+        rows, next_cursor = await fetch_arrow_page(
+            CURRENT_SENSOR_DATA_CQL,
+            None,
+            flight_key("current-sensor-data-cassandra"),
+            auth_data.page_size,
+            auth_data.cursor,
+        )
 
+        return frame_response(request, rows, "sensor_data", next_cursor=next_cursor)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -79,45 +61,36 @@ class SensorDataLatLon(BaseModel):
     password: str
     lat: float
     lon: float
+    page_size: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
 
 
 @router.post("/current-sensor-data-by-lat-lon")
-async def get_sensor_data_by_lat_lon(auth_data: SensorDataLatLon):
+async def get_sensor_data_by_lat_lon(auth_data: SensorDataLatLon, request: Request):
     try:
         print("inside api client get sensor data by LAT LON:")
         print("inside api client get sensor data by LAT LON:", auth_data)
         credentials = {"username": auth_data.username, "password": auth_data.password}
         response = await is_authenticated(AuthRequest(**credentials))
         print("get_sensor_data_by_lat_lon AUTHENTICATED!!!")
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_by_lat_lon 
-        WHERE lat = %s and lon = %s 
-        LIMIT 5
-        """
-        rows = session.execute(query, (auth_data.lat, auth_data.lon))
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        if not data:
+        rows, next_cursor = await fetch_arrow_page(
+            SENSOR_DATA_BY_LAT_LON_CQL,
+            (auth_data.lat, auth_data.lon),
+            flight_key("current-sensor-data-by-lat-lon", lat=auth_data.lat, lon=auth_data.lon),
+            auth_data.page_size,
+            auth_data.cursor,
+        )
+
+        if rows.num_rows == 0 and auth_data.cursor is None:
             raise HTTPException(
                 status_code=404,
                 detail="No sensor data found for the given coordinates.",
             )
 
-        return {"sensor_data": data}
+        return frame_response(request, rows, "sensor_data", next_cursor=next_cursor)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -126,47 +99,38 @@ async def get_sensor_data_by_lat_lon(auth_data: SensorDataLatLon):
 
 
 class SensorDataCountry(BaseModel):
+    username: str
+    password: str
     country: str
-    lat: float
-    lon: float
+    page_size: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
 
 
 @router.post("/current-sensor-data-by-country")
-async def get_sensor_data_by_country(auth_data: SensorDataCountry):
+async def get_sensor_data_by_country(auth_data: SensorDataCountry, request: Request):
     try:
         print("inside api client get sensor data by country:")
         print("inside api client get sensor data by country:", auth_data)
         credentials = {"username": auth_data.username, "password": auth_data.password}
         response = await is_authenticated(AuthRequest(**credentials))
-        print("get_sensor_data_by_lat_lon AUTHENTICATED!!!")
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_processed 
-        WHERE country = %s 
-        LIMIT 5
-        """
-        rows = session.execute(query, (auth_data.lat, auth_data.lon))
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        if not data:
+        print("get_sensor_data_by_country AUTHENTICATED!!!")
+        rows, next_cursor = await fetch_arrow_page(
+            SENSOR_DATA_BY_COUNTRY_CQL,
+            (auth_data.country,),
+            flight_key("current-sensor-data-by-country", country=auth_data.country),
+            auth_data.page_size,
+            auth_data.cursor,
+        )
+
+        if rows.num_rows == 0 and auth_data.cursor is None:
             raise HTTPException(
                 status_code=404,
                 detail="No sensor data found for the given coordinates.",
             )
 
-        return {"sensor_data": data}
+        return frame_response(request, rows, "sensor_data", next_cursor=next_cursor)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
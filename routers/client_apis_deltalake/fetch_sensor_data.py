@@ -1,14 +1,17 @@
 import daft.delta_lake
-from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
-from pydantic import BaseModel
-from utils.cassandra_session import get_cassandra_session
-import httpx
-import logging
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+from utils.auth import AuthRequest, is_authenticated
+from typing import Optional
+from utils.cassandra_async import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_arrow_page
+from utils.singleflight import flight_key
+from utils.executor import run_blocking
 import polars as pl
-import duckdb
+from utils.duckdb_pool import duckdb_cursor, duckdb_query
+from utils.delta_snapshot import get_sensor_snapshot
+from utils.responses import frame_response
 import daft
 from daft.sql import SQLCatalog
-from deltalake import DeltaTable
 
 router = APIRouter()
 
@@ -66,102 +69,54 @@ s3_config = S3Config(
 io_config1 = IOConfig(s3_config)
 
 
-class AuthRequest(BaseModel):
-    username: str
-    password: str
-
-
-CLOUDFLARE_WORKER_URL_LOGIN = (
-    "https://d1-worker-production.rustchain64.workers.dev/api/login"
-)
-
 
-async def is_authenticated(request: AuthRequest):
-    print("inside is_authenticated:", request)
-    logging.info(f"inside cloudflare login auth: {request}")
-    print(f"inside cloudflare login auth: {request}")
-    async with httpx.AsyncClient() as client:
-        print("going to call client")
-        response = await client.post(CLOUDFLARE_WORKER_URL_LOGIN, json=request.dict())
-        print("after calling client", response.json())
-
-    if response.status_code != 200:
-        print("did i get here !200 response???")
-        logging.info("did i get here !200 response???")
-        raise HTTPException(
-            status_code=response.status_code, detail="Authentication failed"
-        )
+def _query_target_table(pl_df):
+    with duckdb_cursor() as con:
+        # register polars df to duckdb table
+        con.register("target_table", pl_df)
 
-    logging.info(f"status code - {response.status_code}")
-    print("status code: ", response.status_code)
-    return {
-        "status": response.status_code,
-        "username": response.json().get("user").get("username"),
-    }
+        return con.execute(
+            """
+            SELECT lat, lon, temp, humidity, country, state 
+            FROM target_table 
+            LIMIT 10
+            """
+        ).pl()
 
 
 @router.post("/current-sensor-data-deltalake")
-async def get_sensor_data(auth_data: AuthRequest):
+async def get_sensor_data(auth_data: AuthRequest, request: Request):
     try:
         print("inside api client get sensor data :")
         print("inside api client get sensor data :", auth_data)
         response = await is_authenticated(auth_data)
-        dt = DeltaTable(
-            read_paths["datasnake_sensor_data_processed_deltalake_remote"],
-            storage_options={
-                "AWS_ACCESS_KEY_ID": "",
-                "AWS_SECRET_ACCESS_KEY": "",
-                "AWS_ENDPOINT": "https://sjc1.vultrobjects.com",
-            },
-        )
 
         # dt = DeltaTable(read_paths["datasnake_sensor_data_processed_deltalake_local"])
 
-        con = duckdb.connect()
-        duckdb.sql(
-            """
-            INSTALL delta;
-            LOAD delta;
-            """
-        )
-
-        # Convert to Polars DataFrame
+        # Convert the shared Delta snapshot to Polars DataFrame
         print("TILL HERE 2")
-        pl_df = pl.from_arrow(dt.to_pyarrow_table())
-        # register polars df to duckdb table
-        con.register("target_table", pl_df)
+        pl_df = pl.from_arrow(await run_blocking("delta", get_sensor_snapshot))
 
-        output_df = con.execute(
-            """
-            SELECT lat, lon, temp, humidity, country, state 
-            FROM target_table 
-            LIMIT 10
-            """
-        ).pl()
+        output_df = await run_blocking("duckdb", _query_target_table, pl_df)
 
         print("printing output df")
         print(output_df.head())
 
-        data = output_df.select(
-            ["lat", "lon", "temp", "humidity", "country", "state"]
-        ).to_dicts()
-        return {"sensor_data": data}
+        data = output_df.select(["lat", "lon", "temp", "humidity", "country", "state"])
+        return frame_response(request, data, "sensor_data")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/current-sensor-data-duckdb-s3")
-async def get_sensor_data(auth_data: AuthRequest):
+async def get_sensor_data(auth_data: AuthRequest, request: Request):
     try:
         print("inside api client get sensor data :")
         print("inside api client get sensor data :", auth_data)
         response = await is_authenticated(auth_data)
 
-        con = duckdb.connect()
-        con.sql("INSTALL delta; LOAD delta;")
-        con.sql("INSTALL httpfs; LOAD httpfs;")
-
+        # delta/httpfs extensions and S3 credentials come preloaded from the pool
         # Dynamically set DuckDB's S3 parameters
         # for key, value in duckdb_storage_options.items():
         #     con.sql(f"SET {key} = '{value}';")
@@ -195,18 +150,39 @@ async def get_sensor_data(auth_data: AuthRequest):
             LIMIT 10
         """
 
-        df = con.execute(query).pl()
+        df = await run_blocking("duckdb", duckdb_query, query)
         print(df.head())
-        con.close()
 
-        data = df.to_dicts()
-
-        return {"sensor_data": data}
+        return frame_response(request, df, "sensor_data")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _daft_sensor_data():
+    df = daft.read_deltalake(
+        table=read_paths["datasnake_sensor_data_processed_deltalake_local"]
+    )
+    catalog = SQLCatalog({"data": df})
+    print("cataglog")
+    print(catalog)
+    results = daft.sql(
+        """
+        SELECT lat, lon, temp, humidity, country, state 
+        FROM df
+        LIMIT 10
+        """,
+        catalog=catalog,
+    )
+
+    print("initial dask df:")
+    print(df.schema())
+    # print(results)
+
+    # result = read_df.collect().to_pydict()  # Triggers execution
+    return results
+
+
 @router.post("/current-sensor-data-daft-s3")
 async def get_sensor_data_daft(auth_data: AuthRequest):
     try:
@@ -214,8 +190,6 @@ async def get_sensor_data_daft(auth_data: AuthRequest):
         print("inside api client get sensor data :", auth_data)
         response = await is_authenticated(auth_data)
 
-        con = duckdb.connect()
-        con.sql("INSTALL delta; LOAD delta;")
         # io_config=io_config,
 
         # read_df = (
@@ -229,26 +203,8 @@ async def get_sensor_data_daft(auth_data: AuthRequest):
         #     .limit(5)
         # )
 
-        df = daft.read_deltalake(
-            table=read_paths["datasnake_sensor_data_processed_deltalake_local"]
-        )
-        catalog = SQLCatalog({"data": df})
-        print("cataglog")
-        print(catalog)
-        results = daft.sql(
-            """
-            SELECT lat, lon, temp, humidity, country, state 
-            FROM df
-            LIMIT 10
-            """,
-            catalog=catalog,
-        )
-
-        print("initial dask df:")
-        print(df.schema())
-        # print(results)
-
-        # result = read_df.collect().to_pydict()  # Triggers execution
+        # daft reads the delta log and plans synchronously, keep it off the event loop
+        results = await run_blocking("delta", _daft_sensor_data)
         print("📦 Result:", results)
 
         # read_df = read_df.select(
@@ -280,50 +236,53 @@ async def get_sensor_data_daft(auth_data: AuthRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+SENSOR_DATA_BY_LAT_LON_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_by_lat_lon
+WHERE lat = ? AND lon = ?
+"""
+SENSOR_DATA_BY_COUNTRY_CQL = """
+SELECT lat, lon, temp, humidity, country, state
+FROM sensor_data_processed
+WHERE country = ?
+"""
+
+
 class SensorDataLatLon(BaseModel):
     username: str
     password: str
     lat: float
     lon: float
+    page_size: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
 
 
 @router.post("/current-sensor-data-by-lat-lon")
-async def get_sensor_data_by_lat_lon(auth_data: SensorDataLatLon):
+async def get_sensor_data_by_lat_lon(auth_data: SensorDataLatLon, request: Request):
     try:
         print("inside api client get sensor data by LAT LON:")
         print("inside api client get sensor data by LAT LON:", auth_data)
         credentials = {"username": auth_data.username, "password": auth_data.password}
         response = await is_authenticated(AuthRequest(**credentials))
         print("get_sensor_data_by_lat_lon AUTHENTICATED!!!")
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_by_lat_lon 
-        WHERE lat = %s and lon = %s 
-        LIMIT 5
-        """
-        rows = session.execute(query, (auth_data.lat, auth_data.lon))
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        if not data:
+        rows, next_cursor = await fetch_arrow_page(
+            SENSOR_DATA_BY_LAT_LON_CQL,
+            (auth_data.lat, auth_data.lon),
+            flight_key("current-sensor-data-by-lat-lon", lat=auth_data.lat, lon=auth_data.lon),
+            auth_data.page_size,
+            auth_data.cursor,
+        )
+
+        if rows.num_rows == 0 and auth_data.cursor is None:
             raise HTTPException(
                 status_code=404,
                 detail="No sensor data found for the given coordinates.",
             )
 
-        return {"sensor_data": data}
+        return frame_response(request, rows, "sensor_data", next_cursor=next_cursor)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -332,47 +291,38 @@ async def get_sensor_data_by_lat_lon(auth_data: SensorDataLatLon):
 
 
 class SensorDataCountry(BaseModel):
+    username: str
+    password: str
     country: str
-    lat: float
-    lon: float
+    page_size: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
 
 
 @router.post("/current-sensor-data-by-country")
-async def get_sensor_data_by_country(auth_data: SensorDataCountry):
+async def get_sensor_data_by_country(auth_data: SensorDataCountry, request: Request):
     try:
         print("inside api client get sensor data by country:")
         print("inside api client get sensor data by country:", auth_data)
         credentials = {"username": auth_data.username, "password": auth_data.password}
         response = await is_authenticated(AuthRequest(**credentials))
-        print("get_sensor_data_by_lat_lon AUTHENTICATED!!!")
-        session = get_cassandra_session()
-        query = """
-        SELECT lat, lon, temp, humidity, country, state 
-        FROM sensor_data_processed 
-        WHERE country = %s 
-        LIMIT 5
-        """
-        rows = session.execute(query, (auth_data.lat, auth_data.lon))
-
-        data = [
-            {
-                "lat": row.lat,
-                "lon": row.lon,
-                "temp": row.temp,
-                "humidity": row.humidity,
-                "country": row.country,
-                "state": row.state,
-            }
-            for row in rows
-        ]
-
-        if not data:
+        print("get_sensor_data_by_country AUTHENTICATED!!!")
+        rows, next_cursor = await fetch_arrow_page(
+            SENSOR_DATA_BY_COUNTRY_CQL,
+            (auth_data.country,),
+            flight_key("current-sensor-data-by-country", country=auth_data.country),
+            auth_data.page_size,
+            auth_data.cursor,
+        )
+
+        if rows.num_rows == 0 and auth_data.cursor is None:
             raise HTTPException(
                 status_code=404,
                 detail="No sensor data found for the given coordinates.",
             )
 
-        return {"sensor_data": data}
+        return frame_response(request, rows, "sensor_data", next_cursor=next_cursor)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Request
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
 import polars as pl
-import duckdb
+from utils.duckdb_pool import duckdb_cursor
+from utils.singleflight import run_blocking_once
+from utils.responses import frame_response, frames_response
+from utils.clickhouse_buckets import query_time_buckets
+from utils.downsample import MAX_DOWNSAMPLE_POINTS, downsample
 import os
 import logging
-from deltalake import DeltaTable
-from datetime import datetime, timedelta
-import ibis
+from utils.delta_snapshot import get_sensor_snapshot
+from utils.sensor_file_index import sensor_file_index
+from utils.sensor_rollups import daily_rollup, hourly_rollup, sensor_rollups
+from datetime import date, datetime
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +30,15 @@ sys.stdout.reconfigure(encoding="utf-8")
 
 router = APIRouter()
 
+# shared query params of the time-series endpoints
+MAX_POINTS_QUERY = Query(
+    None,
+    ge=3,
+    le=MAX_DOWNSAMPLE_POINTS,
+    description="Downsample the series to about this many points",
+)
+DOWNSAMPLE_QUERY = Query("lttb", description="lttb keeps the shape, minmax keeps every peak")
+
 
 @router.get("/dashboard/data")
 def get_dashboard_data():
@@ -53,213 +69,178 @@ storage_options = {
 
 
 @router.get("/sensor-data-temp-timestamp")
-async def get_temp_timestamp_data():
-    """
-    Read data from Delta Lake tables and return as JSON.
+async def get_temp_timestamp_data(
+    request: Request,
+    max_points: Optional[int] = MAX_POINTS_QUERY,
+    downsample_method: Literal["lttb", "minmax"] = DOWNSAMPLE_QUERY,
+):
     """
-    con = duckdb.connect()
-    duckdb.sql(
-        """
-        INSTALL delta;
-        LOAD delta;
-        """
-    )
+    First temperature reading of each of the last 50 hours, from the hourly rollup.
 
-    # {'device_id': '273200253295324-DC:DA:0C:64:79:F8', 'temp': 21.27, 'humidity': 47.57,
-    # 'pressure': 1023.81, 'lat': 45.41007, 'lon': -122.73083, 'alt': 0.0, 'sats': 0, 'wind_speed': 24.4,
-    # 'wind_direction': 78, 'timestamp': '2025-02-21 01:10:00.874345'}
-    query = f"""
-        SELECT *
-        FROM delta_scan('{read_paths['datasnake_sensor_data_processed_deltalake_local']}')
-        WHERE postal_code != 000000
-        limit 50
-        """
-    check_sensor_data_df = con.query(query).pl()
-    print(check_sensor_data_df.head())
-
-    # query = f"""SELECT count(*) FROM delta_scan('{read_paths['datasnake_sensor_data_processed_deltalake_local']}')"""
-    # check_sensor_data_df = con.query(query).pl()
-    # print(check_sensor_data_df.head())
-
-    query = f"""
-    WITH ranked_data AS (
-    SELECT 
-        temp, 
-        DATE_TRUNC('hour', CAST(timestamp AS TIMESTAMP)) AS hour,
-        ROW_NUMBER() OVER (PARTITION BY DATE_TRUNC('hour', CAST(timestamp AS TIMESTAMP)) ORDER BY timestamp) AS rn
-    FROM 
-        delta_scan('{read_paths['datasnake_sensor_data_processed_deltalake_local']}')
-    )
-    SELECT 
-        temp, 
-        hour 
-    FROM 
-        ranked_data 
-    WHERE 
-        rn = 1
-    ORDER BY 
-        hour 
-    DESC
-    LIMIT 50
+    With `max_points` the whole hourly series is returned, downsampled.
     """
-    sensor_data_temp_timestamp_df = con.query(query).pl()
+    hourly_df = await run_blocking_once("delta", sensor_rollups.rollup, "hour")
+    hourly_df = hourly_df.select(
+        pl.col("temp_first").alias("temp"), pl.col("bucket").alias("hour")
+    )
+    if max_points is None:
+        hourly_df = hourly_df.sort("hour", descending=True).head(50)
+    else:
+        hourly_df = downsample(
+            hourly_df.sort("hour"), "hour", ["temp"], max_points, downsample_method
+        )
+    sensor_data_temp_timestamp_df = hourly_df.sort("hour", descending=True)
     print(sensor_data_temp_timestamp_df.head())
-    con.close()
-
-    temp_timestamp_json = sensor_data_temp_timestamp_df.to_dicts()
-    check_sensor_data_json = check_sensor_data_df.to_dicts()
 
-    return {
-        # "check_sensor_data_json": check_sensor_data_json,
-        "temp_timestamp": temp_timestamp_json,
-    }
+    return frame_response(request, sensor_data_temp_timestamp_df, "temp_timestamp")
 
 
 @router.get("/comparative-temp-humidity")
-async def get_comparative_data_daily():
-    con = duckdb.connect()
-    duckdb.sql(
-        """
-        INSTALL delta;
-        LOAD delta;
-        """
+async def get_comparative_data_daily(
+    request: Request,
+    max_points: Optional[int] = MAX_POINTS_QUERY,
+    downsample_method: Literal["lttb", "minmax"] = DOWNSAMPLE_QUERY,
+):
+    # first temperature and humidity reading of each day, from the daily rollup
+    # (first 50 days, or every day downsampled to max_points)
+    df = (await run_blocking_once("delta", daily_rollup)).select(
+        pl.col("bucket").alias("day"),
+        pl.col("temp_first").alias("temp"),
+        pl.col("humidity_first").alias("humidity"),
     )
-
-    # Query to fetch temperature and humidity data
-    query = f"""
-        WITH ranked_data AS (
-        SELECT 
-            DATE_TRUNC('day', CAST(timestamp AS TIMESTAMP)) AS day,
-            temp,
-            humidity,
-            ROW_NUMBER() OVER (PARTITION BY DATE_TRUNC('day', CAST(timestamp AS TIMESTAMP)) ORDER BY timestamp) AS rn
-        FROM 
-            delta_scan('{read_paths['datasnake_sensor_data_processed_deltalake_local']}')
-        )
-        SELECT 
-            day,
-            temp,
-            humidity
-        FROM 
-            ranked_data
-        WHERE 
-            rn = 1
-        ORDER BY 
-            day
-        LIMIT 50
-        """
-
-    # Execute the query and fetch the results
-    df = con.execute(query).pl()
+    if max_points is None:
+        df = df.head(50)
+    else:
+        df = downsample(df, "day", ["temp", "humidity"], max_points, downsample_method)
     print("comparitive temp humidity data:")
     print(df.head())
 
-    # Close the connection
-    con.close()
-
-    # return JSONResponse(content=chart_data)
-    temp_humidity_json = df.to_dicts()
-
-    return {
-        "temp_humidity": temp_humidity_json,
-    }
+    return frame_response(request, df, "temp_humidity")
 
 
 # probly need to find average of temp and pressure for the day first and then use those values
 # create and save more hourly | monthly | yearly
 @router.get("/comparative-temp-pressure")
-async def get_comparative_data_daily():
-    con = duckdb.connect()
-    duckdb.sql(
-        """
-        INSTALL delta;
-        LOAD delta;
-        """
+async def get_comparative_data_daily(
+    request: Request,
+    max_points: Optional[int] = MAX_POINTS_QUERY,
+    downsample_method: Literal["lttb", "minmax"] = DOWNSAMPLE_QUERY,
+):
+    # first temperature and pressure reading of each day, from the daily rollup
+    # (first 50 days, or every day downsampled to max_points)
+    df = (await run_blocking_once("delta", daily_rollup)).select(
+        pl.col("bucket").alias("day"),
+        pl.col("temp_first").alias("temp"),
+        pl.col("pressure_first").alias("pressure"),
     )
-
-    # Query to fetch temperature and humidity data
-    query = f"""
-        WITH ranked_data AS (
-        SELECT 
-            DATE_TRUNC('day', CAST(timestamp AS TIMESTAMP)) AS day,
-            temp,
-            pressure,
-            ROW_NUMBER() OVER (PARTITION BY DATE_TRUNC('day', CAST(timestamp AS TIMESTAMP)) ORDER BY timestamp) AS rn
-        FROM 
-            delta_scan('{read_paths['datasnake_sensor_data_processed_deltalake_local']}')
-        )
-        SELECT 
-            day,
-            temp,
-            pressure
-        FROM 
-            ranked_data
-        WHERE 
-            rn = 1
-        ORDER BY 
-            day
-        LIMIT 50
-        """
-
-    # Execute the query and fetch the results
-    df = con.execute(query).pl()
+    if max_points is None:
+        df = df.head(50)
+    else:
+        df = downsample(df, "day", ["temp", "pressure"], max_points, downsample_method)
     print("comparitive temp pressure data:")
     print(df.head())
 
-    # Close the connection
-    con.close()
+    return frame_response(request, df, "temp_pressure")
+
+
+class ChartSpec(BaseModel):
+    name: str
+    metrics: List[Literal["temp", "humidity", "pressure"]] = Field(min_length=1)
+    granularity: Literal["hour", "day"] = "day"
+    agg: Literal["first", "mean", "min", "max"] = "first"
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    # keep only the most recent `limit` buckets
+    limit: Optional[int] = Field(None, ge=1)
+    max_points: Optional[int] = Field(None, ge=3, le=MAX_DOWNSAMPLE_POINTS)
+    downsample_method: Literal["lttb", "minmax"] = "lttb"
 
-    # return JSONResponse(content=chart_data)
-    temp_pressure_json = df.to_dicts()
+    @field_validator("metrics")
+    @classmethod
+    def _unique_metrics(cls, metrics):
+        # each metric becomes a column of the chart frame
+        if len(set(metrics)) != len(metrics):
+            raise ValueError("metrics must not repeat")
+        return metrics
 
+
+class DashboardBundleRequest(BaseModel):
+    charts: List[ChartSpec]
+
+
+def _chart_plan(rollups, chart: ChartSpec) -> pl.LazyFrame:
+    lf = rollups[chart.granularity]
+    if chart.start_date is not None:
+        lf = lf.filter(
+            pl.col("bucket") >= datetime.combine(chart.start_date, datetime.min.time())
+        )
+    if chart.end_date is not None:
+        lf = lf.filter(
+            pl.col("bucket") < datetime.combine(chart.end_date, datetime.min.time())
+        )
+    lf = lf.select(
+        pl.col("bucket").alias(chart.granularity),
+        *[pl.col(f"{metric}_{chart.agg}").alias(metric) for metric in chart.metrics],
+    ).sort(chart.granularity)
+    if chart.limit is not None:
+        lf = lf.tail(chart.limit)
+    return lf
+
+
+def _dashboard_bundle(charts):
+    # every chart is a projection of the same rollup version, collected as one plan
+    rollups = sensor_rollups.lazy_rollups()
+    frames = pl.collect_all([_chart_plan(rollups, chart) for chart in charts])
     return {
-        "temp_pressure": temp_pressure_json,
+        chart.name: downsample(
+            frame,
+            chart.granularity,
+            chart.metrics,
+            chart.max_points,
+            chart.downsample_method,
+        )
+        for chart, frame in zip(charts, frames)
     }
 
 
+@router.post("/bundle")
+async def get_dashboard_bundle(bundle: DashboardBundleRequest):
+    """
+    Data for several dashboard charts in one request.
+
+    All charts are answered from the hourly / daily rollups in a single Polars
+    plan, so the page load costs one rollup refresh instead of one per chart.
+    """
+    names = [chart.name for chart in bundle.charts]
+    if len(names) != len(set(names)):
+        raise HTTPException(status_code=400, detail="Chart names must be unique")
+
+    version = await run_blocking_once("delta", sensor_rollups.refresh)
+    frames = await run_blocking_once("polars", _dashboard_bundle, bundle.charts)
+    return frames_response(frames, version=version)
+
+
 @router.get("/temperature-vs-hourly-data-experimental")
-async def get_temperature_vs_hourly_data_duckdb():
+async def get_temperature_vs_hourly_data_duckdb(request: Request):
     """
-    Fetch hourly temperature data from Delta Lake.
+    Fetch hourly temperature data (first reading of the last 100 hours) with DuckDB.
     """
-    con = duckdb.connect()
-    con.sql("INSTALL delta; LOAD delta;")
-    con.sql("INSTALL httpfs; LOAD httpfs;")
-
-    duckdb_storage_options = {
-        "s3_access_key_id": access_key,
-        "s3_secret_access_key": secret_key,
-        "s3_endpoint": f"https://{hostname}",
-        "s3_region": "us-east-1",
-        "s3_url_style": "path",
-    }
+    df = await run_blocking_once("duckdb", _temperature_vs_hourly_data_duckdb)
+    print(df.head())
 
-    # Dynamically set DuckDB's S3 parameters
-    for key, value in duckdb_storage_options.items():
-        con.sql(f"SET {key} = '{value}';")
-
-    # con.sql(
-    #     """
-    #     SET s3_endpoint = 'https://sjc1.vultrobjects.com';
-    #     SET s3_access_key_id = '';
-    #     SET s3_secret_access_key = '';
-    #     SET s3_region = 'us-east-1';
-    #     SET s3_url_style: 'path';
-    #     SET s3_allow_unsafe_rename: 'true';
-    #     """
-    # )
-
-    # print(
-    #     f"scanning deltalake: {read_paths['datasnake_sensor_data_processed_deltalake_remote']}"
-    # )
-
-    query = f"""
+    return frame_response(request, df, "temp_hourly")
+
+
+def _temperature_vs_hourly_data_duckdb():
+    # runs over the in-memory snapshot: `timestamp` is already typed and `hour`
+    # precomputed, nothing is cast per row or scanned from S3
+    query = """
     WITH hourly_data AS (
         SELECT
             temp,
-            DATE_TRUNC('hour', CAST(timestamp AS TIMESTAMP)) AS hour,
-            ROW_NUMBER() OVER (PARTITION BY DATE_TRUNC('hour', CAST(timestamp AS TIMESTAMP)) ORDER BY timestamp) AS rn
-        FROM delta_scan('{read_paths['datasnake_sensor_data_processed_deltalake_remote']}')
+            hour,
+            ROW_NUMBER() OVER (PARTITION BY hour ORDER BY timestamp) AS rn
+        FROM sensor_snapshot
     )
     SELECT
         temp,
@@ -272,16 +253,9 @@ async def get_temperature_vs_hourly_data_duckdb():
         hour DESC
     LIMIT 100
     """
-
-    df = con.execute(query).pl()
-    print(df.head())
-    con.close()
-
-    temp_hourly_json = df.to_dicts()
-
-    return {
-        "temp_hourly": temp_hourly_json,
-    }
+    with duckdb_cursor() as con:
+        con.register("sensor_snapshot", get_sensor_snapshot())
+        return con.execute(query).pl()
 
 
 @router.get("/temperature-vs-hourly-data-debug")
@@ -289,147 +263,130 @@ async def get_temperature_vs_hourly_data_debug():
     """
     Fetch hourly temperature data from Delta Lake.
     """
+    return await run_blocking_once("duckdb", _temperature_vs_hourly_data_debug)
+
+
+def _temperature_vs_hourly_data_debug():
     # s3_storage_options = {
     #     "AWS_ACCESS_KEY_ID": access_key,
     #     "AWS_SECRET_ACCESS_KEY": secret_key,
     #     "AWS_ENDPOINT": f"https://{hostname}",
     # }
     print("TILL HERE 1")
-    # 🔹 Load DeltaTable from S3 (Lazy Loading)
-    dt = DeltaTable(
-        "s3://datasnake/deltalake_sensor_data_processed",
-        storage_options={
-            "AWS_ACCESS_KEY_ID": "",
-            "AWS_SECRET_ACCESS_KEY": "",
-            "AWS_ENDPOINT": "https://sjc1.vultrobjects.com",
-        },
-    )
 
-    # 🔹 Connect DuckDB
-    con = duckdb.connect()
+    # 🔹 Borrow a DuckDB cursor
+    with duckdb_cursor() as con:
+        # Convert cached DeltaTable snapshot to Polars DataFrame
+        print("TILL HERE 2")
+        # timestamp is already typed, date / hour are precomputed in the snapshot
+        pl_df = pl.from_arrow(get_sensor_snapshot())
+        print(pl_df.schema)
 
-    # Convert to Polars DataFrame
-    print("TILL HERE 2")
-    pl_df = pl.from_arrow(dt.to_pyarrow_table())
-    print(pl_df.schema)
+        con.register("raw_delta_polars_df", pl_df)
 
-    pl_df = pl_df.with_columns(
-        pl.col("timestamp").str.strptime(
-            pl.Datetime, "%Y-%m-%d %H:%M:%S%.f", strict=True
-        )
-    )
-
-    print(pl_df.schema)
-
-    con.register("raw_delta_polars_df", pl_df)
-
-    latest_dates_df = con.execute(
-        """
-        SELECT DISTINCT strftime(timestamp, '%Y-%m-%d') AS date
-        FROM raw_delta_polars_df
-        ORDER BY date DESC
-        LIMIT 50;
-    """
-    ).pl()
-
-    print("Recent distinct dates from DeltaLake:")
-    print(latest_dates_df)
-
-    # distinct_hours_df = con.execute(
-    #     """
-    #     SELECT DISTINCT strftime(timestamp, '%H') AS hour
-    #     FROM raw_delta_polars_df
-    #     WHERE strftime(timestamp, '%Y-%m-%d') = (
-    #         SELECT MAX(strftime(timestamp, '%Y-%m-%d')) FROM raw_delta_polars_df
-    #     )
-    #     ORDER BY hour ASC;
-    # """
-    # ).pl()
-
-    # print("Distinct hours for the latest date:")
-    # print(distinct_hours_df)
-
-    distinct_date_data_df = con.execute(
-        """
-        WITH latest_date AS (
-            SELECT MAX(strftime(timestamp, '%Y-%m-%d')) AS max_date
+        latest_dates_df = con.execute(
+            """
+            SELECT DISTINCT strftime(timestamp, '%Y-%m-%d') AS date
             FROM raw_delta_polars_df
-        ),
-        filtered_data AS (
+            ORDER BY date DESC
+            LIMIT 50;
+        """
+        ).pl()
+
+        print("Recent distinct dates from DeltaLake:")
+        print(latest_dates_df)
+
+        # distinct_hours_df = con.execute(
+        #     """
+        #     SELECT DISTINCT strftime(timestamp, '%H') AS hour
+        #     FROM raw_delta_polars_df
+        #     WHERE strftime(timestamp, '%Y-%m-%d') = (
+        #         SELECT MAX(strftime(timestamp, '%Y-%m-%d')) FROM raw_delta_polars_df
+        #     )
+        #     ORDER BY hour ASC;
+        # """
+        # ).pl()
+
+        # print("Distinct hours for the latest date:")
+        # print(distinct_hours_df)
+
+        distinct_date_data_df = con.execute(
+            """
+            WITH latest_date AS (
+                SELECT MAX(strftime(timestamp, '%Y-%m-%d')) AS max_date
+                FROM raw_delta_polars_df
+            ),
+            filtered_data AS (
+                SELECT 
+                    strftime(timestamp, '%Y-%m-%d') AS date,  -- Extract Date
+                    strftime(timestamp, '%H') AS hour,        -- Extract Hour
+                    temp
+                FROM raw_delta_polars_df
+                WHERE strftime(timestamp, '%Y-%m-%d') = (SELECT max_date FROM latest_date)  -- Filter for Max Date
+            )
+            SELECT * FROM filtered_data
+            ORDER BY hour ASC;
+            """
+        ).pl()
+
+        print("Distinct data for the latest date:")
+        print(distinct_date_data_df)
+
+        print("reading via deltatable")
+        print(str(pl_df.head()).encode("utf-8", "ignore").decode("utf-8"))
+        # logging.info(pl_df.head())
+
+        # ✅ Step 1: Filter out rows where postal_code == "00000"
+
+        filtered_df = pl_df.filter(pl.col("postal_code") != "00000")
+
+        # ✅ Step 2: `date` and `hour` columns are precomputed in the snapshot
+        print("PRINT filtered df")
+        print(filtered_df.head())
+
+        # ✅ Find the most recent date in the dataset
+        last_date = filtered_df["date"].max()
+        print(f"Most Recent Date: {last_date}")
+
+        # ✅ Filter the last 24 hours of that date
+        # start_time = datetime.combine(
+        #     last_date, datetime.min.time()
+        # )  # Midnight of last date
+        # df = filtered_df.filter(
+        #     (pl.col("timestamp") >= start_time)
+        #     & (pl.col("timestamp") < start_time + timedelta(days=1))
+        # )
+
+        # ✅ Filter data for the latest date only
+        latest_day_df = filtered_df.filter(pl.col("date") == last_date)
+
+        con.register("filterd_df", latest_day_df)
+
+        # ✅ Step 3: Perform DuckDB SQL Aggregation
+        query = """
+            WITH latest_date AS (
+                SELECT MAX(strftime(timestamp, '%Y-%m-%d')) AS max_date
+                FROM raw_delta_polars_df
+            ),
+            hourly_data AS (
+                SELECT 
+                    strftime(timestamp, '%Y-%m-%d') AS date,   -- Extract Date
+                    strftime(timestamp, '%H') AS hour,         -- Extract Hour
+                    temp,
+                    ROW_NUMBER() OVER (PARTITION BY strftime(timestamp, '%Y-%m-%d %H') ORDER BY timestamp) AS rn
+                FROM raw_delta_polars_df
+                WHERE strftime(timestamp, '%Y-%m-%d') = (SELECT max_date FROM latest_date)  -- Filter for Max Date
+            )
             SELECT 
-                strftime(timestamp, '%Y-%m-%d') AS date,  -- Extract Date
-                strftime(timestamp, '%H') AS hour,        -- Extract Hour
+                date,
+                hour,
                 temp
-            FROM raw_delta_polars_df
-            WHERE strftime(timestamp, '%Y-%m-%d') = (SELECT max_date FROM latest_date)  -- Filter for Max Date
-        )
-        SELECT * FROM filtered_data
-        ORDER BY hour ASC;
+            FROM hourly_data
+            WHERE rn = 1
+            ORDER BY hour ASC;
         """
-    ).pl()
-
-    print("Distinct data for the latest date:")
-    print(distinct_date_data_df)
-
-    print("reading via deltatable")
-    print(str(pl_df.head()).encode("utf-8", "ignore").decode("utf-8"))
-    # logging.info(pl_df.head())
-
-    # ✅ Step 1: Filter out rows where postal_code == "00000"
-
-    filtered_df = pl_df.filter(pl.col("postal_code") != "00000")
-
-    # ✅ Step 2: Add `date` and `hour` columns from `timestamp`
-    filtered_df = filtered_df.with_columns(
-        pl.col("timestamp").cast(pl.Datetime).dt.date().alias("date"),
-        pl.col("timestamp").cast(pl.Datetime).dt.truncate("1h").alias("hour"),
-    )
-    print("PRINT filtered df")
-    print(filtered_df.head())
-
-    # ✅ Find the most recent date in the dataset
-    last_date = filtered_df["date"].max()
-    print(f"Most Recent Date: {last_date}")
-
-    # ✅ Filter the last 24 hours of that date
-    # start_time = datetime.combine(
-    #     last_date, datetime.min.time()
-    # )  # Midnight of last date
-    # df = filtered_df.filter(
-    #     (pl.col("timestamp") >= start_time)
-    #     & (pl.col("timestamp") < start_time + timedelta(days=1))
-    # )
 
-    # ✅ Filter data for the latest date only
-    latest_day_df = filtered_df.filter(pl.col("date") == last_date)
-
-    con.register("filterd_df", latest_day_df)
-
-    # ✅ Step 3: Perform DuckDB SQL Aggregation
-    query = """
-        WITH latest_date AS (
-            SELECT MAX(strftime(timestamp, '%Y-%m-%d')) AS max_date
-            FROM raw_delta_polars_df
-        ),
-        hourly_data AS (
-            SELECT 
-                strftime(timestamp, '%Y-%m-%d') AS date,   -- Extract Date
-                strftime(timestamp, '%H') AS hour,         -- Extract Hour
-                temp,
-                ROW_NUMBER() OVER (PARTITION BY strftime(timestamp, '%Y-%m-%d %H') ORDER BY timestamp) AS rn
-            FROM raw_delta_polars_df
-            WHERE strftime(timestamp, '%Y-%m-%d') = (SELECT max_date FROM latest_date)  -- Filter for Max Date
-        )
-        SELECT 
-            date,
-            hour,
-            temp
-        FROM hourly_data
-        WHERE rn = 1
-        ORDER BY hour ASC;
-    """
-
-    agg_df = con.execute(query).pl()  # Returns as Polars DataFrame
+        agg_df = con.execute(query).pl()  # Returns as Polars DataFrame
     print("final agg_df")
     print(agg_df.head())
 
@@ -441,166 +398,57 @@ async def get_temperature_vs_hourly_data_debug():
 
 @router.get("/temperature-vs-hourly-data")
 async def get_temperature_vs_hourly_data(
-    date: str = Query(None, description="Date in YYYY-MM-DD format")
+    request: Request,
+    date: str = Query(None, description="Date in YYYY-MM-DD format"),
 ):
     """
-    Fetch hourly temperature data from Delta Lake.
+    Fetch hourly temperature data (first reading per hour) from the hourly rollup.
     """
-    # s3_storage_options = {
-    #     "AWS_ACCESS_KEY_ID": access_key,
-    #     "AWS_SECRET_ACCESS_KEY": secret_key,
-    #     "AWS_ENDPOINT": f"https://{hostname}",
-    # }
-    print("TILL HERE 1")
-    # 🔹 Load DeltaTable from S3 (Lazy Loading)
-    dt = DeltaTable(
-        "s3://datasnake/deltalake_sensor_data_processed",
-        storage_options={
-            "AWS_ACCESS_KEY_ID": access_key,
-            "AWS_SECRET_ACCESS_KEY": secret_key,
-            "AWS_ENDPOINT": "https://sjc1.vultrobjects.com",
-        },
-    )
-
-    # 🔹 Connect DuckDB
-    con = duckdb.connect()
-
-    # Convert to Polars DataFrame
-    print("TILL HERE 2")
-    pl_df = pl.from_arrow(dt.to_pyarrow_table())
-    print(pl_df.schema)
-
-    pl_df = pl_df.with_columns(
-        pl.col("timestamp").str.strptime(
-            pl.Datetime, "%Y-%m-%d %H:%M:%S%.f", strict=True
-        )
-    )
-
-    # Convert timestamp to Datetime
-    # pl_df = pl_df.with_columns(pl.col("timestamp").cast(pl.Datetime))
-
-    print(pl_df.schema)
-
-    con.register("raw_delta_polars_df", pl_df)
-
-    print("reading via deltatable")
-    # print(str(pl_df.head()).encode("utf-8", "ignore").decode("utf-8"))
-    # logging.info(pl_df.head())
-
-    # ✅ Step 1: Filter out rows where postal_code == "00000"
-    filtered_df = pl_df.filter(pl.col("postal_code") != "00000")
-
     # If no date is provided, find the latest available date
     if date is None:
-        max_date = pl_df.select(pl.col("timestamp").dt.date()).max().item()
+        max_date = await run_blocking_once("delta", sensor_file_index.latest_date)
     else:
         max_date = datetime.strptime(date, "%Y-%m-%d").date()
         print("max_date ===> ")
         print(max_date)
 
-    # Filter data for the selected date
-    filtered_df = pl_df.filter(pl.col("timestamp").dt.date() == max_date)
-
-    con.register("filtered_df", filtered_df)
-
-    # SQL Query for hourly temperature
-    query = """
-        WITH hourly_data AS (
-            SELECT 
-                strftime(timestamp, '%H') AS hour, 
-                temp,
-                ROW_NUMBER() OVER (PARTITION BY strftime(timestamp, '%Y-%m-%d %H') ORDER BY timestamp) AS rn
-            FROM filtered_df
-        )
-        SELECT 
-            hour, 
-            temp 
-        FROM hourly_data
-        WHERE rn = 1
-        ORDER BY hour ASC;
-    """
-
-    agg_df = con.execute(query).pl()  # Returns as Polars DataFrame
+    agg_df = (await run_blocking_once("delta", hourly_rollup, max_date)).select(
+        pl.col("bucket").dt.strftime("%H").alias("hour"),
+        pl.col("temp_first").alias("temp"),
+    )
     print("final agg_df")
     print(agg_df.head())
 
-    # ✅ Step 4: Convert to JSON format
-    temp_hourly_json = agg_df.to_dicts()
-
-    return {"date": str(max_date), "temp_hourly": temp_hourly_json}
+    # ✅ Step 4: Serialize straight from the frame
+    return frame_response(request, agg_df, "temp_hourly", date=str(max_date))
 
 
 @router.get("/temperature-vs-hourly-single-date")
 async def get_temperature_vs_hourly_data(
-    date: str = Query(None, description="Date in YYYY-MM-DD format")
+    request: Request,
+    date: str = Query(None, description="Date in YYYY-MM-DD format"),
 ):
     """
-    Fetch hourly temperature data from Delta Lake for the given date.
+    Fetch hourly temperature data from the hourly rollup for the given date.
     """
-    print("TILL HERE 1")
-
-    # 🔹 Load DeltaTable from S3
-    dt = DeltaTable(
-        "s3://datasnake/deltalake_sensor_data_processed",
-        storage_options={
-            "AWS_ACCESS_KEY_ID": access_key,
-            "AWS_SECRET_ACCESS_KEY": secret_key,
-            "AWS_ENDPOINT": "https://sjc1.vultrobjects.com",
-        },
-    )
-
-    # 🔹 Load into Polars
-    print("TILL HERE 2")
-    pl_df = pl.from_arrow(dt.to_pyarrow_table())
-
-    # Ensure timestamp is parsed correctly
-    pl_df = pl_df.with_columns(
-        pl.col("timestamp").str.strptime(
-            pl.Datetime, "%Y-%m-%d %H:%M:%S%.f", strict=True
-        )
-    )
-
-    print(pl_df.schema)
-
-    # ✅ Filter out invalid postal codes
-    pl_df = pl_df.filter(pl.col("postal_code") != "00000")
-
-    print(pl_df.head(50))
-
     # Get latest date if none provided
     if date is None:
-        max_date = pl_df.select(pl.col("timestamp").dt.date()).max().item()
+        max_date = await run_blocking_once("delta", sensor_file_index.latest_date)
     else:
         max_date = datetime.strptime(date, "%Y-%m-%d").date()
         print("max_date ===>", max_date)
 
-    # Filter rows for that specific date
-    filtered_df = pl_df.filter(pl.col("timestamp").dt.date() == max_date)
-
-    # Extract hour and date for charting
-    enriched_df = filtered_df.with_columns(
-        [
-            pl.col("timestamp").dt.strftime("%H").alias("hour"),
-            pl.col("timestamp").dt.date().alias("date"),
-        ]
-    )
-
-    print(enriched_df.head())
-
-    # Deduplicate by hour (take first record per hour)
-    enriched_df = (
-        enriched_df.sort("timestamp")
-        .unique(subset=["hour"])
-        .select(["date", "hour", "temp"])
-        .sort("hour")
+    # First record per hour, straight from the hourly rollup
+    enriched_df = (await run_blocking_once("delta", hourly_rollup, max_date)).select(
+        pl.col("bucket").dt.date().alias("date"),
+        pl.col("bucket").dt.strftime("%H").alias("hour"),
+        pl.col("temp_first").alias("temp"),
     )
 
     print(enriched_df.head())
 
     # ✅ Format final records
-    records = enriched_df.to_dicts()
-
-    return {"records": records, "meta": {"date": str(max_date)}}
+    return frame_response(request, enriched_df, "records", meta={"date": str(max_date)})
     # # Build all 24 hours => to make up for any data missing hours in a day
     # full_hours = [f"{str(h).zfill(2)}" for h in range(24)]
 
@@ -616,137 +464,95 @@ async def get_temperature_vs_hourly_data(
 
 @router.get("/temperature-humidity-hourly-data")
 async def temperature_humidity_hourly_data(
-    date: str = Query(None, description="Date in YYYY-MM-DD format")
+    request: Request,
+    date: str = Query(None, description="Date in YYYY-MM-DD format"),
 ):
     """
-    Fetch hourly average temperature and humidity data from Delta Lake for a given date.
+    Fetch hourly average temperature and humidity data from the hourly rollup for a given date.
     """
 
-    # 🔹 Load DeltaTable from S3
-    dt = DeltaTable(
-        "s3://datasnake/deltalake_sensor_data_processed",
-        storage_options={
-            "AWS_ACCESS_KEY_ID": access_key,
-            "AWS_SECRET_ACCESS_KEY": secret_key,
-            "AWS_ENDPOINT": "https://sjc1.vultrobjects.com",
-        },
-    )
-
-    # 🔹 Load into Polars DataFrame
-    pl_df = pl.from_arrow(dt.to_pyarrow_table())
-
-    # Ensure timestamp is in correct datetime format
-    pl_df = pl_df.with_columns(
-        pl.col("timestamp").str.strptime(
-            pl.Datetime, "%Y-%m-%d %H:%M:%S%.f", strict=True
-        )
-    )
-
-    # ✅ Filter out invalid postal codes
-    pl_df = pl_df.filter(pl.col("postal_code") != "00000")
-
     # Determine which date to use
     if date is None:
-        max_date = pl_df.select(pl.col("timestamp").dt.date()).max().item()
+        max_date = await run_blocking_once("delta", sensor_file_index.latest_date)
     else:
         max_date = datetime.strptime(date, "%Y-%m-%d").date()
 
-    # Filter data for the given date
-    filtered_df = pl_df.filter(pl.col("timestamp").dt.date() == max_date)
-
-    # Extract hour and aggregate average temperature and humidity
-    enriched_df = (
-        filtered_df.with_columns(
-            [
-                pl.col("timestamp").dt.strftime("%H").alias("hour"),
-                pl.col("timestamp").dt.date().alias("date"),
-            ]
-        )
-        .group_by("hour")
-        .agg(
-            [
-                pl.col("temp").mean().alias("avg_temp"),
-                pl.col("humidity").mean().alias("avg_humidity"),
-            ]
-        )
-        .sort("hour")
+    # Hourly average temperature and humidity from the hourly rollup
+    enriched_df = (await run_blocking_once("delta", hourly_rollup, max_date)).select(
+        pl.col("bucket").dt.strftime("%H").alias("hour"),
+        pl.col("temp_mean").round(2).alias("temperature"),
+        pl.col("humidity_mean").round(2).alias("humidity"),
     )
 
     # ✅ Format final records
-    records = [
-        {
-            "hour": row["hour"],
-            "temperature": round(row["avg_temp"], 2),
-            "humidity": round(row["avg_humidity"], 2),
-        }
-        for row in enriched_df.to_dicts()
-    ]
-
-    return {"records": records, "meta": {"date": str(max_date)}}
+    return frame_response(request, enriched_df, "records", meta={"date": str(max_date)})
 
 
 @router.get("/temperature-vs-daily-data")
-async def get_temperature_data_daily():
+async def get_temperature_data_daily(
+    request: Request,
+    max_points: Optional[int] = MAX_POINTS_QUERY,
+    downsample_method: Literal["lttb", "minmax"] = DOWNSAMPLE_QUERY,
+):
+    """
+    First temperature reading of each day (first 50 days), aggregated inside ClickHouse.
+
+    With `max_points` every day is returned, downsampled.
+    """
     try:
-        print("Inside API client get temperature vs daily data")
-
-        # Connect to ClickHouse via Ibis
-        con = ibis.clickhouse.connect(
-            host="127.0.0.1",
-            port=8123,
-            user="default",
-            password="",  # Add if required
-            database="datasnake",
+        daily = await run_blocking_once(
+            "clickhouse",
+            query_time_buckets,
+            "sensor_data_processed",
+            "processed_at",
+            "day",
+            [("temp", "first", "temp")],
+            limit=50 if max_points is None else None,
         )
-
-        # Define Ibis table and query
-        table = con.table("sensor_data_processed")
-        query = table[["temp", "processed_at"]].limit(500)
-
-        # ✅ Execute query (this returns a pandas DataFrame)
-        result_df = query.execute()
-
-        # ✅ Convert to Polars for consistency (optional)
-        pl_df = pl.DataFrame(result_df)
-
-        # ✅ Convert to JSON-serializable dict list
-        # data = pl_df.to_dicts()
-
-        # con.close()
-
-        con_duck = duckdb.connect()
-        con_duck.register("sensor_data", pl_df)
-
-        # 4. Run the SQL query
-        sql = """
-            WITH ranked_data AS (
-                SELECT 
-                    DATE_TRUNC('day', CAST(processed_at AS TIMESTAMP)) AS day,
-                    temp,
-                    ROW_NUMBER() OVER (
-                        PARTITION BY DATE_TRUNC('day', CAST(processed_at AS TIMESTAMP)) 
-                        ORDER BY processed_at
-                    ) AS rn
-                FROM sensor_data
+        if max_points is not None:
+            daily = downsample(
+                pl.from_arrow(daily), "day", ["temp"], max_points, downsample_method
             )
-            SELECT 
-                day,
-                temp,
-            FROM ranked_data
-            WHERE rn = 1
-            ORDER BY day
-            LIMIT 50
-        """
-        df_result = con_duck.sql(sql).pl()
+        return frame_response(request, daily, "temp_vs_time_daily", status="success")
 
-        # 5. Convert to Arrow -> dicts
-        arrow_table = df_result.to_arrow()
-        temp_humidity_json = df_result.to_dicts()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error fetching sensor data: {str(e)}"
+        )
 
-        print("Query result preview:")
-        print(df_result.head())
 
-        return {"temp_vs_time_daily": temp_humidity_json, "status": "success"}
+@router.get("/time-buckets")
+async def get_time_buckets(
+    request: Request,
+    bucket: Literal["minute", "hour", "day", "week", "month"] = "day",
+    metrics: List[Literal["temp", "humidity", "pressure"]] = Query(["temp"]),
+    agg: Literal["first", "last", "mean", "min", "max", "count"] = "mean",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(500, ge=1, le=100000),
+    max_points: Optional[int] = MAX_POINTS_QUERY,
+    downsample_method: Literal["lttb", "minmax"] = DOWNSAMPLE_QUERY,
+):
+    """
+    Sensor metrics per time bucket, bucketed and aggregated inside ClickHouse.
+    """
+    try:
+        buckets = await run_blocking_once(
+            "clickhouse",
+            query_time_buckets,
+            "sensor_data_processed",
+            "timestamp",
+            bucket,
+            [(metric, agg, metric) for metric in metrics],
+            start=start_date,
+            end=end_date,
+            limit=limit,
+        )
+        if max_points is not None:
+            buckets = downsample(
+                pl.from_arrow(buckets), bucket, metrics, max_points, downsample_method
+            )
+        return frame_response(request, buckets, "buckets", bucket=bucket, agg=agg)
 
     except Exception as e:
         raise HTTPException(
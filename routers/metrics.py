@@ -0,0 +1,38 @@
+from fastapi import APIRouter
+from utils.auth import auth_cache_stats
+from utils.delta_tailer import tailer_stats
+from utils.executor import executor_stats
+from utils.file_cache import delta_file_cache
+from utils.singleflight import singleflight_stats
+
+router = APIRouter()
+
+
+@router.get("/executor")
+def get_executor_metrics():
+    """Per-backend queue depth and in-flight jobs of the analytics executor."""
+    return executor_stats()
+
+
+@router.get("/singleflight")
+def get_singleflight_metrics():
+    """Computations started vs. requests that joined one already in flight."""
+    return singleflight_stats()
+
+
+@router.get("/file-cache")
+def get_file_cache_metrics():
+    """Size, hit and miss counts of the local Delta parquet file cache."""
+    return delta_file_cache.stats()
+
+
+@router.get("/delta-tailer")
+def get_delta_tailer_metrics():
+    """Delta log version seen vs. applied, and time since the last catch-up."""
+    return tailer_stats()
+
+
+@router.get("/auth-cache")
+def get_auth_cache_metrics():
+    """Logins answered from the credential cache vs. sent to the Cloudflare worker."""
+    return auth_cache_stats()
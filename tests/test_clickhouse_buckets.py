@@ -0,0 +1,147 @@
+from datetime import date, datetime
+
+import pyarrow as pa
+import pytest
+
+clickhouse_connect = pytest.importorskip("clickhouse_connect")
+
+from utils import clickhouse_buckets  # noqa: E402
+from utils.clickhouse_buckets import query_time_buckets, time_bucket_query  # noqa: E402
+
+TIME = "CAST(`sensor_data_processed`.`processed_at` AS DateTime64(6))"
+
+
+def test_daily_first_last_query():
+    sql, parameters = time_bucket_query(
+        "sensor_data_processed",
+        "processed_at",
+        "day",
+        [("temp", "first", "temp"), ("temp", "last", "last_temp"), ("humidity", "mean", "humidity")],
+        start=date(2025, 4, 1),
+        end=datetime(2025, 4, 8, 12, 30),
+        limit=50,
+    )
+
+    assert sql == (
+        f"SELECT toStartOfDay({TIME}) AS `day`, "
+        f"argMin(`sensor_data_processed`.`temp`, {TIME}) AS `temp`, "
+        f"argMax(`sensor_data_processed`.`temp`, {TIME}) AS `last_temp`, "
+        "avg(`sensor_data_processed`.`humidity`) AS `humidity` "
+        "FROM `sensor_data_processed` "
+        f"WHERE ({TIME} >= {{start:DateTime64(6)}}) "
+        f"AND ({TIME} < {{end:DateTime64(6)}}) "
+        "GROUP BY `day` ORDER BY `day` LIMIT 50"
+    )
+    # dates are widened to midnight so they bind as DateTime64
+    assert parameters == {
+        "start": datetime(2025, 4, 1),
+        "end": datetime(2025, 4, 8, 12, 30),
+    }
+
+
+@pytest.mark.parametrize(
+    "bucket, function",
+    [("minute", "toStartOfMinute"), ("hour", "toStartOfHour"), ("week", "toMonday"), ("month", "toStartOfMonth")],
+)
+def test_bucket_functions(bucket, function):
+    sql, parameters = time_bucket_query("t", "ts", bucket, [("v", "max", "v")], bucket_alias="bucket")
+
+    assert sql.startswith(
+        f"SELECT {function}(CAST(`t`.`ts` AS DateTime64(6))) AS `bucket`, max(`t`.`v`) AS `v` FROM `t`"
+    )
+    assert sql.endswith("GROUP BY `bucket` ORDER BY `bucket`")
+    assert "WHERE" not in sql and "LIMIT" not in sql
+    assert parameters == {}
+
+
+@pytest.mark.parametrize(
+    "table, time_column, metrics",
+    [
+        ("t; DROP TABLE t", "ts", [("v", "mean", "v")]),
+        ("t", "ts`) --", [("v", "mean", "v")]),
+        ("t", "ts", [("v) FROM system.users --", "mean", "v")]),
+        ("t", "ts", [("v", "mean", "1v")]),
+    ],
+)
+def test_rejects_bad_identifiers(table, time_column, metrics):
+    with pytest.raises(ValueError, match="Invalid column or table name"):
+        time_bucket_query(table, time_column, "day", metrics)
+
+
+def test_rejects_unknown_bucket_and_aggregation():
+    with pytest.raises(ValueError, match="Unknown bucket"):
+        time_bucket_query("t", "ts", "fortnight", [("v", "mean", "v")])
+    with pytest.raises(ValueError, match="Unknown aggregation"):
+        time_bucket_query("t", "ts", "day", [("v", "median", "v")])
+
+
+class StubClient:
+    def __init__(self, result):
+        self.result = result
+        self.queries = []
+        self.closed = False
+
+    def query_arrow(self, sql, parameters=None):
+        self.queries.append((sql, parameters))
+        return self.result
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """Stub clickhouse_connect.get_client, recording every client it creates."""
+    clients = []
+
+    def get_client(**kwargs):
+        clients.append(StubClient(pa.table({"day": pa.array([], pa.timestamp("s"))})))
+        return clients[-1]
+
+    monkeypatch.setattr(clickhouse_buckets, "_client", None)
+    monkeypatch.setattr(clickhouse_connect, "get_client", get_client)
+    return clients
+
+
+def test_query_time_buckets_binds_range_and_returns_arrow(connect):
+    # shape of a recorded query_arrow response for the daily temperature chart
+    recorded = pa.table(
+        {
+            "day": pa.array([datetime(2025, 4, 1), datetime(2025, 4, 2)], pa.timestamp("s")),
+            "temp": pa.array([18.5, 21.25]),
+        }
+    )
+    client = clickhouse_buckets.get_clickhouse_client()
+    client.result = recorded
+
+    result = query_time_buckets(
+        "sensor_data_processed",
+        "processed_at",
+        "day",
+        [("temp", "first", "temp")],
+        start=date(2025, 4, 1),
+        limit=50,
+    )
+
+    assert result.equals(recorded)
+    [(sql, parameters)] = client.queries
+    assert sql.startswith(f"SELECT toStartOfDay({TIME}) AS `day`, argMin(")
+    assert f"WHERE ({TIME} >= {{start:DateTime64(6)}}) GROUP BY `day`" in sql
+    assert sql.endswith("LIMIT 50")
+    # the date bound is passed as a parameter, never formatted into the SQL
+    assert parameters == {"start": datetime(2025, 4, 1)}
+    assert "2025" not in sql
+
+
+def test_query_time_buckets_reuses_one_client(connect):
+    query_time_buckets("t", "ts", "hour", [("v", "mean", "v")])
+    query_time_buckets("t", "ts", "day", [("v", "max", "v")], end=date(2025, 4, 8))
+
+    [client] = connect
+    assert [parameters for _, parameters in client.queries] == [{}, {"end": datetime(2025, 4, 8)}]
+    assert not client.closed
+
+    clickhouse_buckets.close_clickhouse_client()
+    assert client.closed
+    query_time_buckets("t", "ts", "hour", [("v", "mean", "v")])
+    assert len(connect) == 2
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+from utils.downsample import downsample, lttb_indices, minmax_indices
+
+
+def sequential_lttb(x, y, n_out):
+    # reference: the textbook one-bucket-at-a-time LTTB
+    n = len(x)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = [0]
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        a = kept[-1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        kept.append(start + int(np.argmax(area)))
+    return np.array(kept + [n - 1])
+
+
+def random_walk(n, seed=0):
+    return np.cumsum(np.random.default_rng(seed).normal(size=n))
+
+
+@pytest.mark.parametrize("n, n_out", [(10, 3), (10, 5), (1000, 100), (10_000, 997)])
+def test_lttb_point_count_and_endpoints(n, n_out):
+    indices = lttb_indices(np.arange(n, dtype=float), random_walk(n), n_out)
+
+    assert len(indices) == n_out
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert (np.diff(indices) > 0).all()
+
+
+@pytest.mark.parametrize("n, n_out", [(50, 7), (1000, 100), (20_000, 500)])
+def test_lttb_matches_sequential_algorithm(n, n_out):
+    x = np.sort(np.random.default_rng(1).uniform(0, 1000, n))
+    y = random_walk(n, seed=2)
+
+    np.testing.assert_array_equal(lttb_indices(x, y, n_out), sequential_lttb(x, y, n_out))
+
+
+def test_lttb_keeps_spikes():
+    y = np.sin(np.linspace(0, 20, 5000))
+    y[1234] = 50.0
+    y[3210] = -50.0
+
+    indices = lttb_indices(np.arange(5000, dtype=float), y, 100)
+
+    assert 1234 in indices and 3210 in indices
+
+
+def test_lttb_handles_missing_values():
+    y = random_walk(1000)
+    y[100:300] = np.nan
+
+    indices = lttb_indices(np.arange(1000, dtype=float), y, 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+
+
+def test_lttb_returns_everything_when_under_budget():
+    np.testing.assert_array_equal(lttb_indices(np.arange(5.0), np.ones(5), 10), np.arange(5))
+
+
+@pytest.mark.parametrize("n, n_out", [(1000, 100), (1001, 64), (10_000, 2)])
+def test_minmax_point_count_and_endpoints(n, n_out):
+    indices = minmax_indices(random_walk(n), n_out)
+
+    assert len(indices) <= n_out + 2
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert (np.diff(indices) > 0).all()
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    y = random_walk(1000)
+    y[123] = 100.0
+    y[877] = -100.0
+
+    indices = minmax_indices(y, 20)
+
+    assert 123 in indices and 877 in indices
+    for bucket in np.array_split(np.arange(1000), 10):
+        assert bucket[np.argmax(y[bucket])] in indices
+        assert bucket[np.argmin(y[bucket])] in indices
+
+
+def test_downsample_frame():
+    start = datetime(2025, 1, 1)
+    df = pl.DataFrame(
+        {
+            "hour": [start + timedelta(hours=i) for i in range(2000)],
+            "temp": random_walk(2000),
+            "humidity": random_walk(2000, seed=3),
+        }
+    )
+    df[500, "temp"] = 1000.0
+
+    lttb = downsample(df, "hour", ["temp", "humidity"], 200, "lttb")
+    minmax = downsample(df, "hour", ["temp", "humidity"], 200, "minmax")
+
+    assert lttb.height == 200
+    assert minmax.height <= 200 + 4
+    for result in (lttb, minmax):
+        assert result["hour"].is_sorted()
+        assert result["hour"][0] == df["hour"][0] and result["hour"][-1] == df["hour"][-1]
+        assert result["temp"].max() == 1000.0
+    assert downsample(df, "hour", ["temp"], None).height == 2000
+    with pytest.raises(ValueError, match="Unknown downsample method"):
+        downsample(df, "hour", ["temp"], 100, "average")
@@ -0,0 +1,20 @@
+import pyarrow.fs as pafs
+
+from utils.file_cache import LocalFileCache
+
+
+def test_refetch_with_new_size_replaces_entry_bytes(tmp_path):
+    remote = tmp_path / "remote.parquet"
+    remote.write_bytes(b"x" * 10)
+    cache = LocalFileCache(str(tmp_path / "cache"), 1024)
+    filesystem = pafs.LocalFileSystem()
+
+    cache.fetch(filesystem, str(remote), size=10)
+    remote.write_bytes(b"x" * 25)
+    # the cached copy no longer matches the expected size, so it is fetched again
+    cache.fetch(filesystem, str(remote), size=25)
+
+    assert cache.stats()["files"] == 1
+    assert cache.stats()["bytes"] == 25
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert cache.lookup(str(remote), size=25) is not None
@@ -0,0 +1,38 @@
+from datetime import date, datetime, timezone
+
+import orjson
+import polars as pl
+from fastapi.encoders import jsonable_encoder
+
+from utils.responses import frames_response
+
+
+def test_datetimes_match_jsonable_encoder():
+    rows = [
+        {"timestamp": datetime(2025, 1, 1, 5), "day": date(2025, 1, 1), "temp": 1.5},
+        {"timestamp": datetime(2025, 1, 1, 5, 0, 0, 123000), "day": None, "temp": None},
+        {"timestamp": None, "day": date(2025, 1, 2), "temp": 2.0},
+    ]
+    body = orjson.loads(frames_response({"data": pl.DataFrame(rows)}, count=3).body)
+
+    assert body["data"] == jsonable_encoder(rows)
+    assert body["data"][0]["timestamp"] == "2025-01-01T05:00:00"
+    assert body["data"][1]["timestamp"] == "2025-01-01T05:00:00.123000"
+    assert body["count"] == 3
+
+
+def test_datetime_precision_and_time_zone():
+    moment = datetime(2025, 1, 1, 5, 0, 0, 250)
+    df = pl.DataFrame({"us": [moment]}).with_columns(
+        pl.col("us").cast(pl.Datetime("ms")).alias("ms"),
+        pl.col("us").cast(pl.Datetime("ns")).alias("ns"),
+        pl.col("us").dt.replace_time_zone("UTC").alias("utc"),
+    )
+    (row,) = orjson.loads(frames_response({"data": df}).body)["data"]
+
+    assert row == {
+        "us": "2025-01-01T05:00:00.000250",
+        "ms": "2025-01-01T05:00:00",
+        "ns": "2025-01-01T05:00:00.000250",
+        "utc": moment.replace(tzinfo=timezone.utc).isoformat(),
+    }
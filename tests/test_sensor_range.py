@@ -0,0 +1,56 @@
+from datetime import date, datetime
+
+import pyarrow as pa
+import pytest
+from deltalake import write_deltalake
+
+from utils import file_cache, sensor_file_index
+from utils.delta_snapshot import DeltaSnapshotCache
+from utils.file_cache import LocalFileCache
+from utils.sensor_file_index import read_sensor_range
+
+
+def readings(day, postal_codes):
+    return pa.table(
+        {
+            "timestamp": [f"{day} {hour:02d}:00:00.0" for hour in range(len(postal_codes))],
+            "device_id": ["d1"] * len(postal_codes),
+            "temp": [float(hour) for hour in range(len(postal_codes))],
+            "postal_code": postal_codes,
+        }
+    )
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    uri = str(tmp_path / "sensor")
+    # one data file per day
+    write_deltalake(uri, readings("2025-01-01", ["10001", "00000", "10002"]))
+    write_deltalake(uri, readings("2025-01-02", ["10001", "10003"]), mode="append")
+    write_deltalake(uri, readings("2025-01-03", ["00000", "00000"]), mode="append")
+    cache = DeltaSnapshotCache(uri, {})
+    monkeypatch.setattr(sensor_file_index, "sensor_snapshot", cache)
+    monkeypatch.setattr(file_cache, "delta_file_cache", LocalFileCache(str(tmp_path / "cache"), 0))
+    return cache
+
+
+def test_reads_only_files_and_rows_in_range(snapshot):
+    batches = list(read_sensor_range(date(2025, 1, 1), date(2025, 1, 2), ["timestamp", "temp"]))
+
+    assert [(read, total) for read, total, _ in batches] == [(1, 1)]
+    table = batches[0][2]
+    assert table.column_names == ["timestamp", "temp", "date", "hour"]
+    assert table.column("timestamp").to_pylist() == [
+        datetime(2025, 1, 1, 0),
+        datetime(2025, 1, 1, 2),
+    ]
+    # the snapshot itself is never loaded
+    assert snapshot.version() == -1
+
+
+def test_skips_files_without_valid_readings(snapshot):
+    batches = list(read_sensor_range(files_per_batch=1))
+
+    # the 2025-01-03 file holds only invalid postal codes
+    assert [(read, total) for read, total, _ in batches] == [(1, 2), (2, 2)]
+    assert sum(table.num_rows for _, _, table in batches) == 4
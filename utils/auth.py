@@ -0,0 +1,109 @@
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+import httpx
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from utils.singleflight import coalesce
+
+CLOUDFLARE_WORKER_URL_LOGIN = (
+    "https://d1-worker-production.rustchain64.workers.dev/api/login"
+)
+
+# seconds a successful / rejected login is answered from memory
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_NEGATIVE_CACHE_TTL = float(os.getenv("AUTH_NEGATIVE_CACHE_TTL", "10"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# per-process salt: cache keys can't be matched against precomputed hashes and
+# nothing derived from a password outlives the process
+_salt = secrets.token_bytes(32)
+# credential hash -> (expires_at, auth result or rejected status code)
+_cache = OrderedDict()
+_stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+_client = None
+
+
+class AuthRequest(BaseModel):
+    username: str
+    password: str
+
+
+def _credential_key(request: AuthRequest) -> str:
+    message = request.username.encode() + b"\0" + request.password.encode()
+    return hmac.new(_salt, message, hashlib.sha256).hexdigest()
+
+
+def _get_client():
+    # one connection pool for the worker, so misses skip the TLS handshake too
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient()
+    return _client
+
+
+async def close_auth_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _remember(key, value, ttl):
+    _cache[key] = (time.monotonic() + ttl, value)
+    _cache.move_to_end(key)
+    while len(_cache) > AUTH_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+async def _login(key, request: AuthRequest):
+    response = await _get_client().post(CLOUDFLARE_WORKER_URL_LOGIN, json=request.dict())
+    if response.status_code != 200:
+        logging.info(f"cloudflare login rejected {request.username}: {response.status_code}")
+        # worker / network errors aren't the client's fault, only cache rejections
+        if 400 <= response.status_code < 500:
+            _remember(key, response.status_code, AUTH_NEGATIVE_CACHE_TTL)
+        raise HTTPException(
+            status_code=response.status_code, detail="Authentication failed"
+        )
+
+    result = {
+        "status": response.status_code,
+        "username": response.json().get("user").get("username"),
+    }
+    _remember(key, result, AUTH_CACHE_TTL)
+    return result
+
+
+async def is_authenticated(request: AuthRequest):
+    """
+    Check username / password against the Cloudflare worker login.
+
+    Results are cached for AUTH_CACHE_TTL seconds (rejections for
+    AUTH_NEGATIVE_CACHE_TTL) under a salted hash of the credentials, and
+    concurrent checks of the same credentials share one worker call.
+    """
+    key = _credential_key(request)
+    entry = _cache.get(key)
+    if entry is not None:
+        expires_at, value = entry
+        if expires_at > time.monotonic():
+            if isinstance(value, dict):
+                _stats["hits"] += 1
+                return value
+            _stats["negative_hits"] += 1
+            raise HTTPException(status_code=value, detail="Authentication failed")
+        del _cache[key]
+
+    _stats["misses"] += 1
+    return await coalesce(f"auth:{key}", _login, key, request)
+
+
+def auth_cache_stats():
+    return {**_stats, "entries": len(_cache)}
@@ -0,0 +1,222 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+
+import pyarrow as pa
+from cassandra.query import SimpleStatement
+from fastapi import HTTPException
+
+from utils import cassandra_session
+from utils.executor import run_blocking
+
+# signs the paging cursors handed to clients; set it so cursors stay valid
+# across restarts and between workers, otherwise a per-process key is used
+PAGING_CURSOR_SECRET = (
+    os.getenv("PAGING_CURSOR_SECRET", "").encode() or secrets.token_bytes(32)
+)
+
+DEFAULT_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 1000
+
+_SIGNATURE_BYTES = 16
+
+
+class AsyncPager:
+    """
+    asyncio view of a driver ResponseFuture.
+
+    The driver calls back from its own event-loop thread once per page; each
+    page is handed to the awaiting coroutine through an asyncio future, so no
+    worker thread sits blocked on the network while a query is in flight.
+    """
+
+    def __init__(self, response_future, loop=None):
+        self._response_future = response_future
+        self._loop = loop or asyncio.get_running_loop()
+        self._paging_state = None
+        self._page = self._loop.create_future()
+        response_future.add_callbacks(self._on_page, self._on_error)
+
+    def _on_page(self, rows):
+        self._loop.call_soon_threadsafe(_resolve, self._page, rows, None)
+
+    def _on_error(self, exc):
+        self._loop.call_soon_threadsafe(_resolve, self._page, None, exc)
+
+    @property
+    def has_more_pages(self):
+        return self._response_future.has_more_pages
+
+    @property
+    def paging_state(self):
+        """Opaque driver token to resume after the last page returned, None at the end."""
+        return self._paging_state
+
+    async def next_page(self):
+        """
+        Rows of the next page, [] once exhausted.
+
+        A page is whatever the profile's row factory builds: a list of rows by
+        default, a pyarrow Table with COLUMNAR_PROFILE.
+
+        The following page is only requested when this is called again, so a
+        caller that stops after one page doesn't trigger extra reads.
+        """
+        if self._page is None:
+            if not self._response_future.has_more_pages:
+                return []
+            self._page = self._loop.create_future()
+            self._response_future.start_fetching_next_page()
+        rows = await self._page
+        self._page = None
+        # not exposed publicly on ResponseFuture, only on the sync ResultSet
+        self._paging_state = self._response_future._paging_state
+        return rows
+
+    async def pages(self):
+        yield await self.next_page()
+        while self._response_future.has_more_pages:
+            yield await self.next_page()
+
+    def __aiter__(self):
+        return self._rows()
+
+    async def _rows(self):
+        async for page in self.pages():
+            for row in page:
+                yield row
+
+
+def _resolve(future, rows, exc):
+    # the awaiting request may have been cancelled while the driver was busy
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(rows)
+
+
+async def get_session():
+    """Shared session; only the first call (the connect) goes through the executor."""
+    session = cassandra_session._session
+    if session is None:
+        session = await run_blocking("cassandra", cassandra_session.get_cassandra_session)
+    return session
+
+
+async def prepare(cql):
+    """Cached prepared statement for `cql`, preparing it off the event loop once."""
+    statement = cassandra_session._prepared.get(cql)
+    if statement is None:
+        statement = await run_blocking("cassandra", cassandra_session.prepared, cql)
+    return statement
+
+
+async def execute_paged(query, parameters=None, fetch_size=None, **kwargs) -> AsyncPager:
+    """
+    Start `query` with `session.execute_async` and return an AsyncPager.
+
+    `query` is CQL text or a prepared statement. Iterate the pager with
+    `async for row in pager` (pages are fetched as they're consumed) or pull
+    pages with `await pager.next_page()`. Extra kwargs (e.g. `paging_state`)
+    go to `execute_async`.
+    """
+    session = await get_session()
+    if fetch_size is not None:
+        if isinstance(query, str):
+            query = SimpleStatement(query, fetch_size=fetch_size)
+        else:
+            query = query.bind(parameters or ())
+            query.fetch_size = fetch_size
+            parameters = None
+    return AsyncPager(session.execute_async(query, parameters, **kwargs))
+
+
+async def execute(query, parameters=None, **kwargs) -> list:
+    """Run `query` without blocking the event loop and return every row."""
+    pager = await execute_paged(query, parameters, **kwargs)
+    rows = []
+    async for page in pager.pages():
+        rows.extend(page)
+    return rows
+
+
+async def execute_arrow(query, parameters=None, **kwargs) -> pa.Table:
+    """Run `query` with the columnar profile and return every page as one Arrow table."""
+    pager = await execute_paged(
+        query, parameters, execution_profile=cassandra_session.COLUMNAR_PROFILE, **kwargs
+    )
+    tables = [page async for page in pager.pages()]
+    return pa.concat_tables(tables, promote_options="default")
+
+
+def _signature(paging_state: bytes, query_key: str) -> bytes:
+    message = query_key.encode() + b"\0" + paging_state
+    return hmac.new(PAGING_CURSOR_SECRET, message, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+
+def encode_cursor(paging_state: bytes, query_key: str) -> str:
+    """
+    Opaque, signed cursor for a driver paging_state.
+
+    The signature covers `query_key` (endpoint + bound values), so a cursor
+    can only resume the query it came from.
+    """
+    token = _signature(paging_state, query_key) + paging_state
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, query_key: str) -> bytes:
+    """paging_state inside `cursor`; raises 400 if it's malformed or was tampered with."""
+    try:
+        token = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    signature, paging_state = token[:_SIGNATURE_BYTES], token[_SIGNATURE_BYTES:]
+    if not paging_state or not hmac.compare_digest(
+        signature, _signature(paging_state, query_key)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return paging_state
+
+
+async def fetch_page(statement, parameters, query_key, page_size, cursor=None, **kwargs):
+    """
+    One page of `statement` and the cursor for the next one (None on the last page).
+
+    Resuming from the driver paging_state costs the same at any depth: the
+    coordinator continues where the previous page stopped instead of
+    re-reading and skipping earlier rows. Extra kwargs (e.g.
+    `execution_profile`) go to `execute_async`.
+    """
+    paging_state = decode_cursor(cursor, query_key) if cursor else None
+    pager = await execute_paged(
+        statement, parameters, fetch_size=page_size, paging_state=paging_state, **kwargs
+    )
+    rows = await pager.next_page()
+    next_cursor = (
+        encode_cursor(pager.paging_state, query_key) if pager.paging_state else None
+    )
+    return rows, next_cursor
+
+
+async def fetch_arrow_page(cql, parameters, query_key, page_size, cursor=None):
+    """
+    One page of `cql` as an Arrow table, and the cursor for the next one.
+
+    The statement is prepared once on the shared session and bound per
+    request; clients page with page_size / cursor instead of a fixed LIMIT.
+    """
+    statement = await prepare(cql)
+    return await fetch_page(
+        statement,
+        parameters,
+        query_key,
+        page_size,
+        cursor,
+        execution_profile=cassandra_session.COLUMNAR_PROFILE,
+    )
@@ -1,18 +1,95 @@
+import logging
+import os
+import threading
+
+import pyarrow as pa
 from cassandra.auth import PlainTextAuthProvider
-from cassandra.cluster import Cluster
+from cassandra.cluster import EXEC_PROFILE_DEFAULT, Cluster, ExecutionProfile
+
+cassandra_user = os.getenv("CASSANDRA_USER", "")
+cassandra_password = os.getenv("CASSANDRA_PASSWORD", "")
+cassandra_hosts = os.getenv("CASSANDRA_HOSTS", "127.0.0.1").split(",")
+cassandra_keyspace = os.getenv("CASSANDRA_KEYSPACE", "datasnake")
+
+# execution profile whose result pages come back as Arrow tables
+COLUMNAR_PROFILE = "columnar"
+
+_cluster = None
+_session = None
+_prepared = {}
+_init_lock = threading.Lock()
+
+
+def arrow_row_factory(colnames, rows):
+    """
+    Decode a result page into a pyarrow Table, one array per column.
+
+    Skips building a named tuple per row; the page goes straight to the same
+    columnar serializer as the Delta and ClickHouse results.
+    """
+    columns = zip(*rows) if rows else [()] * len(colnames)
+    return pa.table(
+        {name: pa.array(values) for name, values in zip(colnames, columns)}
+    )
 
-cassandra_user = ""
-cassandra_password = ""
+
+def init_cassandra():
+    """
+    Connect the shared Cassandra cluster and session once.
+
+    The driver session is thread-safe and keeps its own connection pool per
+    host, so every request borrows the same one instead of paying for a new
+    cluster handshake.
+    """
+    global _cluster, _session
+    with _init_lock:
+        if _session is None:
+            auth_provider = PlainTextAuthProvider(cassandra_user, cassandra_password)
+            cluster = Cluster(
+                cassandra_hosts,
+                auth_provider=auth_provider,
+                execution_profiles={
+                    EXEC_PROFILE_DEFAULT: ExecutionProfile(),
+                    COLUMNAR_PROFILE: ExecutionProfile(row_factory=arrow_row_factory),
+                },
+            )
+            try:
+                _session = cluster.connect(cassandra_keyspace)
+            except Exception:
+                cluster.shutdown()
+                raise
+            _cluster = cluster
+            logging.info(f"cassandra session ready on {cassandra_hosts}")
+    return _session
+
+
+def shutdown_cassandra():
+    global _cluster, _session
+    with _init_lock:
+        if _cluster is not None:
+            _cluster.shutdown()
+        _cluster = None
+        _session = None
+        _prepared.clear()
 
 
 def get_cassandra_session():
-    auth_provider = PlainTextAuthProvider(
-        cassandra_user, cassandra_password
-    )  # Update credentials
-    # 127.0.0.1
-    cluster = Cluster(
-        ["127.0.0.1"], auth_provider=auth_provider
-    )  # Update with actual IP
-    session = cluster.connect()
-    session.set_keyspace("datasnake")
-    return session
+    """Return the shared session, connecting on first use."""
+    return _session if _session is not None else init_cassandra()
+
+
+def prepared(cql):
+    """
+    Prepare `cql` once on the shared session and return the cached statement.
+
+    Bind values per request (`session.execute(prepared(cql), params)`) so the
+    coordinator skips re-parsing and routes by the partition key.
+    """
+    statement = _prepared.get(cql)
+    if statement is None:
+        session = get_cassandra_session()
+        with _init_lock:
+            statement = _prepared.get(cql)
+            if statement is None:
+                statement = _prepared[cql] = session.prepare(cql)
+    return statement
@@ -0,0 +1,137 @@
+import os
+import re
+import threading
+from datetime import date, datetime
+
+import clickhouse_connect
+import pyarrow as pa
+
+# bucket name -> ClickHouse function truncating a DateTime to the bucket start
+BUCKET_FUNCTIONS = {
+    "minute": "toStartOfMinute",
+    "hour": "toStartOfHour",
+    "day": "toStartOfDay",
+    "week": "toMonday",
+    "month": "toStartOfMonth",
+}
+
+# aggregation name -> ClickHouse aggregate, `first` / `last` by the time column
+AGGREGATIONS = {
+    "first": "argMin({column}, {time_column})",
+    "last": "argMax({column}, {time_column})",
+    "mean": "avg({column})",
+    "min": "min({column})",
+    "max": "max({column})",
+    "count": "count({column})",
+}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_clickhouse_client():
+    """
+    One ClickHouse client for the worker, created on first use.
+
+    Without a session id the HTTP client can run queries from several
+    threads at once over its connection pool.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = clickhouse_connect.get_client(
+                host=os.getenv("CLICKHOUSE_HOST", "127.0.0.1"),
+                port=int(os.getenv("CLICKHOUSE_PORT", 8123)),
+                user=os.getenv("CLICKHOUSE_USER", "default"),
+                password=os.getenv("CLICKHOUSE_PASSWORD", ""),
+                database=os.getenv("CLICKHOUSE_SENSOR_DATABASE", "datasnake"),
+                autogenerate_session_id=False,
+            )
+        return _client
+
+
+def close_clickhouse_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def _identifier(name):
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column or table name: {name!r}")
+    return f"`{name}`"
+
+
+def _as_datetime(value):
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+
+def time_bucket_query(
+    table,
+    time_column,
+    bucket,
+    metrics,
+    start=None,
+    end=None,
+    limit=None,
+    bucket_alias=None,
+):
+    """
+    Compile a time-bucketed aggregation into one ClickHouse query.
+
+    `metrics` is a list of (column, aggregation, alias) tuples. Rows are
+    restricted to start <= time_column < end and bucketed with the matching
+    toStartOf* function, so only one row per bucket leaves ClickHouse. Values
+    are bound as server-side parameters. Returns (sql, parameters).
+
+    The time column is cast to DateTime64(6) as the original DuckDB query did
+    (`CAST(processed_at AS TIMESTAMP)`), so a String column buckets the same
+    as a DateTime one.
+    """
+    if bucket not in BUCKET_FUNCTIONS:
+        raise ValueError(f"Unknown bucket {bucket!r}, expected one of {list(BUCKET_FUNCTIONS)}")
+    # columns are table-qualified so an alias equal to a column name doesn't
+    # shadow it inside the aggregate (`avg(temp) AS temp`)
+    table_sql = _identifier(table)
+    time_sql = f"CAST({table_sql}.{_identifier(time_column)} AS DateTime64(6))"
+    bucket_sql = _identifier(bucket_alias or bucket)
+
+    select = [f"{BUCKET_FUNCTIONS[bucket]}({time_sql}) AS {bucket_sql}"]
+    for column, aggregation, alias in metrics:
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(
+                f"Unknown aggregation {aggregation!r}, expected one of {list(AGGREGATIONS)}"
+            )
+        expression = AGGREGATIONS[aggregation].format(
+            column=f"{table_sql}.{_identifier(column)}", time_column=time_sql
+        )
+        select.append(f"{expression} AS {_identifier(alias)}")
+
+    conditions = []
+    parameters = {}
+    if start is not None:
+        conditions.append(f"{time_sql} >= {{start:DateTime64(6)}}")
+        parameters["start"] = _as_datetime(start)
+    if end is not None:
+        conditions.append(f"{time_sql} < {{end:DateTime64(6)}}")
+        parameters["end"] = _as_datetime(end)
+
+    sql = f"SELECT {', '.join(select)} FROM {table_sql}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+    sql += f" GROUP BY {bucket_sql} ORDER BY {bucket_sql}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql, parameters
+
+
+def query_time_buckets(table, time_column, bucket, metrics, **kwargs) -> pa.Table:
+    """Run `time_bucket_query` and return the aggregated rows as an Arrow table."""
+    sql, parameters = time_bucket_query(table, time_column, bucket, metrics, **kwargs)
+    return get_clickhouse_client().query_arrow(sql, parameters=parameters)
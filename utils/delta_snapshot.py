@@ -0,0 +1,299 @@
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.dataset as ds
+from deltalake import DeltaTable
+
+from utils.file_cache import cached_files
+
+hostname = "sjc1.vultrobjects.com"
+
+SENSOR_DELTA_TABLE_URI = "s3://datasnake/deltalake_sensor_data_processed"
+
+sensor_delta_storage_options = {
+    "AWS_ACCESS_KEY_ID": os.getenv("AWS_ACCESS_KEY", ""),
+    "AWS_SECRET_ACCESS_KEY": os.getenv("AWS_SECRET_KEY", ""),
+    "AWS_ENDPOINT": f"https://{hostname}",
+}
+
+# how often (seconds) we are allowed to ask the delta log for a newer version
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("DELTA_SNAPSHOT_CHECK_INTERVAL", "10"))
+
+# format of the string `timestamp` column written by the ingestion pipeline
+SENSOR_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S%.f"
+
+
+def prepare_sensor_rows(table: pa.Table) -> pa.Table:
+    """
+    Parse the string `timestamp` into a native timestamp and add `date` / `hour`.
+
+    Done once per data file when it is read, so requests never re-parse strings.
+    """
+    df = pl.from_arrow(table)
+    if "timestamp" in df.columns and df.schema["timestamp"] == pl.String:
+        df = df.with_columns(
+            pl.col("timestamp").str.strptime(
+                pl.Datetime("us"), SENSOR_TIMESTAMP_FORMAT, strict=True
+            )
+        ).with_columns(
+            pl.col("timestamp").dt.date().alias("date"),
+            pl.col("timestamp").dt.truncate("1h").alias("hour"),
+        )
+    return df.to_arrow(compat_level=pl.CompatLevel.oldest())
+
+
+def file_sizes(add_actions) -> dict:
+    """Data file path -> size in bytes, from the Delta add actions."""
+    return dict(
+        zip(
+            add_actions.column("path").to_pylist(),
+            add_actions.column("size_bytes").to_pylist(),
+        )
+    )
+
+
+def read_sensor_files(dataset, paths, columns=None, filter=None, sizes=None) -> pa.Table:
+    """
+    Read only the data files in `paths` from a Delta pyarrow dataset, typed.
+
+    Files go through the local disk cache, so each one is downloaded once.
+    """
+    names = {path.rsplit("/", 1)[-1] for path in paths}
+    fragments = [
+        fragment
+        for fragment in dataset.get_fragments()
+        if fragment.path.rsplit("/", 1)[-1] in names
+    ]
+    with cached_files(dataset, fragments, sizes) as files_dataset:
+        table = files_dataset.to_table(columns=columns, filter=filter)
+    return prepare_sensor_rows(table)
+
+
+class DeltaSnapshotCache:
+    """
+    Keeps the latest version of a Delta table in memory as a typed Arrow table.
+
+    New table versions are applied incrementally: only files added since the
+    cached version are read (and their timestamps parsed) and appended. If
+    files were removed (optimize / overwrite) the snapshot is rebuilt.
+
+    Subscribers (rollups, indexes) are handed the rows read for each new
+    version, so every data file is read once however many caches use it.
+    """
+
+    def __init__(self, table_uri, storage_options, check_interval=SNAPSHOT_CHECK_INTERVAL):
+        self.table_uri = table_uri
+        self.storage_options = storage_options
+        self.check_interval = check_interval
+        # set while the delta tailer keeps the snapshot current in the background
+        self.tailed = False
+        self._lock = threading.Lock()
+        self._dt = None
+        self._table = None
+        self._files = set()
+        self._version = -1
+        self._last_check = 0.0
+        self._subscribers = []
+
+    def _refresh_handle(self):
+        """Bring the DeltaTable handle up to date, at most once per check_interval."""
+        now = time.monotonic()
+        if self._dt is None:
+            self._dt = DeltaTable(self.table_uri, storage_options=self.storage_options)
+            self._last_check = now
+        elif now - self._last_check >= self.check_interval:
+            self._dt.update_incremental()
+            self._last_check = now
+        return self._dt.version()
+
+    def subscribe(self, subscriber):
+        """
+        Feed `subscriber` every applied version.
+
+        It is called as `subscriber.apply(version, add_actions, rows, rebuild)`
+        with the typed rows added since its `version()`, or with all rows and
+        `rebuild=True` when it has to start over.
+        """
+        if subscriber not in self._subscribers:
+            self._subscribers.append(subscriber)
+
+    def get(self):
+        """
+        Return (version, pyarrow.Table) for the latest known table version.
+
+        While the delta tailer is running the last applied version is returned
+        as is, so requests never wait for a catch-up.
+        """
+        if self.tailed and self._table is not None:
+            return self._version, self._table
+        return self.update()
+
+    def update(self):
+        """Apply the latest table version to the snapshot and its subscribers."""
+        with self._lock:
+            previous = self._version
+            version = self._refresh_handle()
+            new_rows = None
+            rebuilt = False
+            if version > self._version:
+                sizes = file_sizes(self._dt.get_add_actions(flatten=True))
+                files = set(sizes)
+                if not self._files <= files:
+                    logging.info(f"delta snapshot {self.table_uri}: files removed, rebuilding")
+                    self._files = set()
+                    self._table = None
+
+                new_files = files - self._files
+                if new_files or self._table is None:
+                    rebuilt = self._table is None
+                    new_rows = read_sensor_files(
+                        self._dt.to_pyarrow_dataset(), new_files, sizes=sizes
+                    )
+                    if self._table is None:
+                        self._table = new_rows
+                    else:
+                        self._table = pa.concat_tables(
+                            [self._table, new_rows], promote_options="default"
+                        )
+                logging.info(
+                    f"delta snapshot {self.table_uri}: version {self._version} -> {version}, "
+                    f"{len(new_files)} new files"
+                )
+                self._files = files
+                self._version = version
+            self._publish(previous, new_rows, rebuilt)
+            return self._version, self._table
+
+    def _publish(self, previous, new_rows, rebuilt):
+        """Bring every subscriber to the snapshot version, rows are read only once."""
+        lagging = [s for s in self._subscribers if s.version() != self._version]
+        if not lagging:
+            return
+        add_actions = self._dt.get_add_actions(flatten=True)
+        if new_rows is None:
+            new_rows = self._table.slice(0, 0)
+        for subscriber in lagging:
+            try:
+                if not rebuilt and subscriber.version() == previous:
+                    subscriber.apply(self._version, add_actions, new_rows, False)
+                else:
+                    # new, failed earlier or the files were rewritten: replay everything
+                    subscriber.apply(self._version, add_actions, self._table, True)
+            except Exception as e:
+                # stays behind and is replayed on the next update
+                logging.error(
+                    f"delta snapshot {self.table_uri}: {type(subscriber).__name__} failed: {e}"
+                )
+
+    def lagging(self):
+        """Names of the subscribers not at the snapshot version."""
+        return [
+            type(subscriber).__name__
+            for subscriber in self._subscribers
+            if subscriber.version() != self._version
+        ]
+
+    def latest_version(self):
+        """Latest table version from the delta log, without loading any data."""
+        with self._lock:
+            return self._refresh_handle()
+
+    def file_state(self):
+        """Return (version, add actions, parquet file dataset) for the latest table version."""
+        with self._lock:
+            version = self._refresh_handle()
+            return (
+                version,
+                self._dt.get_add_actions(flatten=True),
+                self._dt.to_pyarrow_dataset(),
+            )
+
+    def version(self):
+        return self._version
+
+
+class SnapshotSubscriber:
+    """
+    State folded incrementally from the rows a DeltaSnapshotCache applies.
+
+    Subclasses set `name` (for logs) and `columns`, and implement `_fold`.
+    With `columns` set, the valid readings among the new rows are handed over
+    as a Polars frame of those columns; without, the Arrow rows as they are.
+    `_fold` returns the attributes to replace, built without the lock, and
+    they are swapped in together with the version, so readers never wait on
+    a fold.
+    """
+
+    name = "snapshot subscriber"
+    columns = None
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._version = -1
+        if snapshot is not None:
+            snapshot.subscribe(self)
+
+    def _fold(self, version, add_actions, rows, rebuild) -> dict:
+        """New values of the state attributes after `rows` (all rows when `rebuild`)."""
+        raise NotImplementedError
+
+    def apply(self, version, add_actions, rows, rebuild):
+        """Fold the snapshot rows added at `version` in (all rows on `rebuild`)."""
+        if self.columns is not None:
+            rows = pl.from_arrow(rows.filter(sensor_data_filter()).select(self.columns))
+        self._update(version, add_actions, rows, rebuild)
+
+    def _update(self, version, add_actions, rows, rebuild=False):
+        state = self._fold(version, add_actions, rows, rebuild)
+        with self._lock:
+            logging.info(
+                f"{self.name}: version {self._version} -> {version}, "
+                f"{len(rows)} rows{' (rebuilt)' if rebuild else ''}"
+            )
+            for attribute, value in state.items():
+                setattr(self, attribute, value)
+            self._version = version
+
+    def refresh(self):
+        """Catch up with the delta log, unless the delta tailer does that in the background."""
+        if self._version < 0 or not self.snapshot.tailed:
+            self.snapshot.update()
+        return self._version
+
+    def version(self):
+        return self._version
+
+
+sensor_snapshot = DeltaSnapshotCache(SENSOR_DELTA_TABLE_URI, sensor_delta_storage_options)
+
+
+def get_sensor_snapshot() -> pa.Table:
+    """
+    Latest in-memory snapshot of deltalake_sensor_data_processed.
+
+    `timestamp` is a native timestamp and `date` / `hour` are precomputed.
+    """
+    _, table = sensor_snapshot.get()
+    return table
+
+
+def sensor_data_filter(start_date: date = None, end_date: date = None):
+    """
+    Row filter for valid sensor readings with start_date <= timestamp < end_date.
+
+    On the parquet files `timestamp` is a 'YYYY-MM-DD HH:MM:SS.f' string, so
+    plain string comparison against 'YYYY-MM-DD' bounds selects whole days and
+    can use the parquet min/max statistics.
+    """
+    expression = ds.field("postal_code") != "00000"
+    if start_date is not None:
+        expression = expression & (ds.field("timestamp") >= start_date.isoformat())
+    if end_date is not None:
+        expression = expression & (ds.field("timestamp") < end_date.isoformat())
+    return expression
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+
+from utils.delta_snapshot import SNAPSHOT_CHECK_INTERVAL, sensor_snapshot
+from utils.device_day_sync import DEVICE_DAY_SYNC_ENABLED, device_day_sync
+from utils.geohash_sync import GEOHASH_SYNC_ENABLED, geohash_sync
+from utils.executor import run_blocking
+from utils.regional_rollups import regional_rollups
+from utils.sensor_file_index import sensor_file_index
+from utils.sensor_locations import sensor_locations
+from utils.sensor_rollups import sensor_rollups
+
+DELTA_TAILER_ENABLED = os.getenv("DELTA_TAILER_ENABLED", "true").lower() == "true"
+
+# seconds between polls of the delta log
+DELTA_TAILER_INTERVAL = float(os.getenv("DELTA_TAILER_INTERVAL", str(SNAPSHOT_CHECK_INTERVAL)))
+
+_task = None
+_stats = {
+    "latest_version": None,
+    "applied_version": None,
+    "last_poll": None,
+    "last_refresh": None,
+    "last_refresh_seconds": None,
+    "errors": 0,
+    "last_error": None,
+}
+
+
+def _catch_up():
+    """
+    Apply the newly added files to the snapshot, the indexes and the rollups.
+
+    The snapshot reads each new file once and hands its rows to the indexes,
+    rollups and the device/day table sync subscribed to it.
+    """
+    sensor_snapshot.update()
+    lagging = sensor_snapshot.lagging()
+    if lagging:
+        raise RuntimeError(f"not caught up: {', '.join(lagging)}")
+
+
+async def tail_delta_log():
+    """
+    Poll the sensor Delta log and fold every new version into the in-memory state.
+
+    Runs for the lifetime of the app, so requests find the snapshot, rollups
+    and latest-date index already caught up with ingestion and serve them as
+    they are instead of checking the log themselves.
+    """
+    while True:
+        try:
+            version = await run_blocking("delta", sensor_snapshot.latest_version)
+            _stats["latest_version"] = version
+            _stats["last_poll"] = time.time()
+            if version != _stats["applied_version"]:
+                started = time.monotonic()
+                await run_blocking("delta", _catch_up)
+                _stats["applied_version"] = version
+                _stats["last_refresh"] = time.time()
+                _stats["last_refresh_seconds"] = round(time.monotonic() - started, 3)
+                logging.info(
+                    f"delta tailer: caught up to version {version} "
+                    f"in {_stats['last_refresh_seconds']}s"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats["errors"] += 1
+            _stats["last_error"] = str(e)
+            logging.error(f"delta tailer: refresh failed: {e}")
+        await asyncio.sleep(DELTA_TAILER_INTERVAL)
+
+
+def start_delta_tailer():
+    global _task
+    if DELTA_TAILER_ENABLED and _task is None:
+        # the Cassandra read tables follow the versions the tailer applies
+        if DEVICE_DAY_SYNC_ENABLED:
+            sensor_snapshot.subscribe(device_day_sync)
+        if GEOHASH_SYNC_ENABLED:
+            sensor_snapshot.subscribe(geohash_sync)
+        sensor_snapshot.tailed = True
+        _task = asyncio.create_task(tail_delta_log())
+
+
+async def stop_delta_tailer():
+    global _task
+    sensor_snapshot.tailed = False
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+def tailer_stats():
+    """Versions seen vs. applied per component, and how stale the in-memory state is."""
+    latest = _stats["latest_version"]
+    components = {
+        "snapshot": sensor_snapshot.version(),
+        "file_index": sensor_file_index.version(),
+        "rollups": sensor_rollups.version(),
+        "regional_rollups": regional_rollups.version(),
+        "sensor_locations": sensor_locations.version(),
+    }
+    if DEVICE_DAY_SYNC_ENABLED:
+        components["device_day_sync"] = device_day_sync.version()
+    if GEOHASH_SYNC_ENABLED:
+        components["geohash_sync"] = geohash_sync.version()
+    return {
+        "enabled": DELTA_TAILER_ENABLED,
+        "running": _task is not None and not _task.done(),
+        **_stats,
+        "versions": components,
+        "device_day_sync": device_day_sync.stats(),
+        "geohash_sync": geohash_sync.stats(),
+        "version_lag": {
+            name: (latest - version if latest is not None else None)
+            for name, version in components.items()
+        },
+        "seconds_since_refresh": (
+            round(time.time() - _stats["last_refresh"], 3)
+            if _stats["last_refresh"] is not None
+            else None
+        ),
+    }
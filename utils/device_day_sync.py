@@ -0,0 +1,103 @@
+import logging
+import os
+from datetime import timedelta
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from cassandra.concurrent import execute_concurrent_with_args
+
+from utils.cassandra_session import get_cassandra_session, prepared
+from utils.delta_snapshot import SnapshotSubscriber, sensor_data_filter
+
+DEVICE_DAY_SYNC_ENABLED = os.getenv("DEVICE_DAY_SYNC_ENABLED", "true").lower() == "true"
+
+# days re-upserted when the snapshot is (re)loaded, to cover readings ingested
+# while the app was down; older gaps are for jobs/backfill_sensor_device_day.py
+DEVICE_DAY_RESYNC_DAYS = int(os.getenv("DEVICE_DAY_RESYNC_DAYS", "2"))
+
+DEVICE_DAY_COLUMNS = [
+    "device_id",
+    "date",
+    "timestamp",
+    "lat",
+    "lon",
+    "temp",
+    "humidity",
+    "pressure",
+    "country",
+    "state",
+    "city",
+    "postal_code",
+]
+
+INSERT_CQL = """
+INSERT INTO sensor_data_by_device_day (
+    device_id, day, timestamp,
+    lat, lon, temp, humidity, pressure, country, state, city, postal_code
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def write_device_days(table, concurrency=64):
+    """
+    Upsert typed sensor rows into their (device_id, day) partitions.
+
+    Returns (written, failed). Writes are keyed on (device_id, day, timestamp),
+    so rows can be written again safely.
+    """
+    rows = [
+        row
+        for row in zip(*(table.column(name).to_pylist() for name in DEVICE_DAY_COLUMNS))
+        if row[0] is not None
+    ]
+    written = 0
+    failed = 0
+    for success, result in execute_concurrent_with_args(
+        get_cassandra_session(),
+        prepared(INSERT_CQL),
+        rows,
+        concurrency=concurrency,
+        raise_on_first_error=False,
+    ):
+        if success:
+            written += 1
+        else:
+            failed += 1
+            logging.error(f"device/day insert failed: {result}")
+    return written, failed
+
+
+class DeviceDaySync(SnapshotSubscriber):
+    """
+    Keeps sensor_data_by_device_day up to date with the sensor Delta table.
+
+    Subscribed to the snapshot by the delta tailer: the rows added by every
+    new version are upserted as they are applied. A failed version is
+    retried with the most recent days on the next catch-up.
+    """
+
+    name = "device/day sync"
+
+    def __init__(self):
+        self._stats = {"written": 0, "failed": 0}
+        super().__init__(None)
+
+    def _fold(self, version, add_actions, rows, rebuild):
+        if rebuild and rows.num_rows:
+            latest = pc.max(rows.column("date")).as_py()
+            if latest is not None:
+                since = latest - timedelta(days=DEVICE_DAY_RESYNC_DAYS - 1)
+                rows = rows.filter(ds.field("date") >= since)
+        written, failed = write_device_days(rows.filter(sensor_data_filter()))
+        self._stats["written"] += written
+        self._stats["failed"] += failed
+        if failed:
+            # the version isn't advanced, the snapshot replays the latest days
+            raise RuntimeError(f"{failed} device/day upserts failed at version {version}")
+        return {}
+
+    def stats(self):
+        return dict(self._stats)
+
+
+device_day_sync = DeviceDaySync()
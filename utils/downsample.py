@@ -0,0 +1,97 @@
+import math
+
+import numpy as np
+import polars as pl
+
+DOWNSAMPLE_METHODS = ["lttb", "minmax"]
+
+# largest point budget a request may ask for
+MAX_DOWNSAMPLE_POINTS = 10_000
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points keeping the visual shape.
+
+    First and last points are always kept. Each bucket in between keeps the
+    point forming the largest triangle with the previously kept point and the
+    average of the next bucket. `x` must be sorted ascending.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_y = y[next_start:next_end]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[a] if np.isnan(next_y).all() else np.nanmean(next_y)
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + (0 if np.isnan(area).all() else int(np.nanargmax(area)))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Min-max decimation: indices of the min and max of each of `n_out // 2` buckets.
+
+    Keeps every peak and trough, at most `n_out` points (plus the first and last).
+    """
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+
+    n_buckets = max(1, n_out // 2)
+    size = math.ceil(n / n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    mins = offsets + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)
+    maxs = offsets + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)
+    indices = np.concatenate([[0, n - 1], mins, maxs])
+    return np.unique(indices[indices < n])
+
+
+def _as_float(series: pl.Series) -> np.ndarray:
+    if series.dtype.is_temporal():
+        series = series.to_physical()
+    return series.cast(pl.Float64).to_numpy()
+
+
+def downsample(
+    df: pl.DataFrame, x: str, y_columns, max_points: int, method: str = "lttb"
+) -> pl.DataFrame:
+    """
+    Reduce `df` (sorted by `x`) to at most about `max_points` rows for charting.
+
+    `lttb` picks points by the first of `y_columns`. `minmax` keeps the min
+    and max of every bucket for each of `y_columns`, splitting the point
+    budget between them.
+    """
+    if max_points is None or df.height <= max_points:
+        return df
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(
+            f"Unknown downsample method {method!r}, expected one of {DOWNSAMPLE_METHODS}"
+        )
+
+    if method == "lttb":
+        indices = lttb_indices(_as_float(df[x]), _as_float(df[y_columns[0]]), max_points)
+    else:
+        per_column = max(2, max_points // len(y_columns))
+        indices = np.unique(
+            np.concatenate(
+                [minmax_indices(_as_float(df[column]), per_column) for column in y_columns]
+            )
+        )
+    return df[indices]
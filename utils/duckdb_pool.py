@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import duckdb
+
+hostname = "sjc1.vultrobjects.com"
+
+# max number of cursors handed out at the same time
+DUCKDB_POOL_SIZE = int(os.getenv("DUCKDB_POOL_SIZE", "8"))
+
+duckdb_s3_secret = {
+    "KEY_ID": os.getenv("AWS_ACCESS_KEY", ""),
+    "SECRET": os.getenv("AWS_SECRET_KEY", ""),
+    "ENDPOINT": hostname,
+    "REGION": "us-east-1",
+    "URL_STYLE": "path",
+}
+
+_database = None
+_init_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DUCKDB_POOL_SIZE)
+
+
+def _sql_string(value) -> str:
+    """`value` as a single-quoted SQL string literal, quotes escaped."""
+    value = str(value)
+    if "\0" in value:
+        raise ValueError("NUL byte in DuckDB string literal")
+    return "'" + value.replace("'", "''") + "'"
+
+
+def init_duckdb_pool():
+    """
+    Create the shared DuckDB database once: delta + httpfs loaded, S3 secret set.
+
+    Extensions, secrets and the object cache live on the database instance,
+    so every cursor borrowed from it can delta_scan S3 without any setup.
+    """
+    global _database
+    with _init_lock:
+        if _database is None:
+            con = duckdb.connect()
+            con.sql("INSTALL delta; LOAD delta;")
+            con.sql("INSTALL httpfs; LOAD httpfs;")
+            con.sql("SET enable_object_cache = true;")
+            secret_options = ", ".join(
+                f"{key} {_sql_string(value)}" for key, value in duckdb_s3_secret.items()
+            )
+            con.sql(f"CREATE OR REPLACE SECRET datasnake_s3 (TYPE s3, {secret_options});")
+            _database = con
+            logging.info(f"duckdb pool ready with {DUCKDB_POOL_SIZE} cursors")
+    return _database
+
+
+def close_duckdb_pool():
+    global _database
+    with _init_lock:
+        if _database is not None:
+            _database.close()
+            _database = None
+
+
+@contextmanager
+def duckdb_cursor():
+    """
+    Borrow a cursor on the shared DuckDB database for the length of a request.
+
+    Each cursor is its own connection (registered frames don't leak between
+    requests) and is closed when the block exits.
+    """
+    database = init_duckdb_pool()
+    with _slots:
+        cursor = database.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+
+def duckdb_query(sql):
+    """Run `sql` on a borrowed cursor and return the result as a Polars DataFrame."""
+    with duckdb_cursor() as con:
+        return con.execute(sql).pl()
+
+
+def sandboxed_query(sql, tables: dict):
+    """
+    Run untrusted (e.g. LLM generated) `sql` and return a Polars DataFrame.
+
+    Uses its own throwaway connection, never the shared database: no httpfs,
+    no S3 secret, and only the Arrow `tables` registered as views. External
+    access (files, network, extension installs) is disabled and the
+    configuration locked before `sql` runs, so it can't read or write outside
+    those tables or change settings for anyone else.
+    """
+    con = duckdb.connect(
+        config={
+            "autoinstall_known_extensions": False,
+            "autoload_known_extensions": False,
+        }
+    )
+    try:
+        for name, table in tables.items():
+            con.register(name, table)
+        con.execute("SET enable_external_access = false")
+        con.execute("SET lock_configuration = true")
+        return con.execute(sql).pl()
+    finally:
+        con.close()
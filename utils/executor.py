@@ -0,0 +1,92 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# DuckDB, Polars, pyarrow/deltalake and the Cassandra/ClickHouse drivers release
+# the GIL while they work, so a thread pool is enough to use several cores.
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+# max concurrent jobs per backend, extra jobs wait (and are counted as queued)
+BACKEND_LIMITS = {
+    "delta": int(os.getenv("DELTA_CONCURRENCY", "4")),
+    "duckdb": int(os.getenv("DUCKDB_CONCURRENCY", os.getenv("DUCKDB_POOL_SIZE", "8"))),
+    "polars": int(os.getenv("POLARS_CONCURRENCY", "4")),
+    "clickhouse": int(os.getenv("CLICKHOUSE_CONCURRENCY", "8")),
+    "cassandra": int(os.getenv("CASSANDRA_CONCURRENCY", "16")),
+}
+
+_executor = None
+_semaphores = {}
+_stats = {
+    backend: {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+    for backend in BACKEND_LIMITS
+}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=ANALYTICS_WORKERS, thread_name_prefix="analytics"
+        )
+    return _executor
+
+
+def _get_semaphore(backend):
+    # asyncio semaphores are bound to the running loop, create them lazily there
+    semaphore = _semaphores.get(backend)
+    if semaphore is None:
+        semaphore = _semaphores[backend] = asyncio.Semaphore(BACKEND_LIMITS[backend])
+    return semaphore
+
+
+async def run_blocking(backend, fn, *args, **kwargs):
+    """
+    Run a blocking call on the shared analytics pool without stalling the event loop.
+
+    `backend` picks the concurrency limit ("delta", "duckdb", "polars",
+    "clickhouse", "cassandra"); calls over the limit wait their turn.
+    """
+    stats = _stats[backend]
+    semaphore = _get_semaphore(backend)
+
+    stats["queued"] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        stats["queued"] -= 1
+
+    stats["running"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_executor(), functools.partial(fn, *args, **kwargs)
+        )
+    except Exception:
+        stats["failed"] += 1
+        raise
+    finally:
+        stats["running"] -= 1
+        stats["completed"] += 1
+        semaphore.release()
+
+
+def executor_stats():
+    """Queue depth, in-flight and completed counts per backend."""
+    return {
+        "workers": ANALYTICS_WORKERS,
+        "backends": {
+            backend: {"limit": BACKEND_LIMITS[backend], **stats}
+            for backend, stats in _stats.items()
+        },
+    }
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        logging.info("shutting down analytics executor")
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+# where downloaded Delta data files are kept, and how much disk they may use
+DELTA_FILE_CACHE_DIR = os.getenv("DELTA_FILE_CACHE_DIR", "/tmp/datasnake-delta-cache")
+DELTA_FILE_CACHE_MAX_BYTES = int(
+    os.getenv("DELTA_FILE_CACHE_MAX_BYTES", str(10 * 1024**3))
+)
+
+_COPY_CHUNK = 8 * 1024 * 1024
+
+
+class LocalFileCache:
+    """
+    Size-capped LRU cache of remote files on local disk.
+
+    Entries are keyed on the remote path and checked against the expected
+    size when it is known. Delta data files are never rewritten in place
+    (every write gets a new file name), so that is enough to tell a cached
+    copy is still the right one. Recency is kept in memory and mirrored in the
+    file mtime, so a restart keeps the LRU order. Files pinned by a running
+    scan are never evicted.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._bytes = 0
+        self._pins = Counter()
+        self.hits = 0
+        self.misses = 0
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _load_index(self):
+        cached = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".parquet"):
+                stat = entry.stat()
+                cached.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(cached):
+            self._entries[name] = size
+            self._bytes += size
+        logging.info(
+            f"file cache {self.directory}: {len(self._entries)} files, {self._bytes} bytes"
+        )
+
+    @staticmethod
+    def _key(remote_path):
+        digest = hashlib.sha256(remote_path.encode()).hexdigest()
+        return f"{digest}.parquet"
+
+    def _local_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def lookup(self, remote_path, size=None, pin=False):
+        """Local path of a cached copy of `remote_path`, or None. `pin` it until `release`."""
+        key = self._key(remote_path)
+        local_path = self._local_path(key)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            if size is not None and self._entries[key] != size:
+                return None
+            if not os.path.exists(local_path):
+                self._bytes -= self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            if pin:
+                self._pins[key] += 1
+        os.utime(local_path)
+        return local_path
+
+    def fetch(self, filesystem, remote_path, size=None, pin=False):
+        """Local path of `remote_path`, downloading it through `filesystem` on a miss."""
+        local_path = self.lookup(remote_path, size, pin)
+        if local_path is not None:
+            self.hits += 1
+            return local_path
+
+        self.misses += 1
+        key = self._key(remote_path)
+        local_path = self._local_path(key)
+        # download next to the final name and rename, readers never see partial files
+        partial_path = f"{local_path}.{uuid.uuid4().hex}.part"
+        with filesystem.open_input_stream(remote_path) as source, open(
+            partial_path, "wb"
+        ) as target:
+            while chunk := source.read(_COPY_CHUNK):
+                target.write(chunk)
+        os.replace(partial_path, local_path)
+        fetched_size = os.path.getsize(local_path)
+
+        with self._lock:
+            # a re-fetch (size changed, or a concurrent miss) replaces the old entry
+            self._bytes += fetched_size - self._entries.get(key, 0)
+            self._entries[key] = fetched_size
+            self._entries.move_to_end(key)
+            self._pins[key] += 1
+            self._evict()
+            if not pin:
+                self._pins[key] -= 1
+        return local_path
+
+    def release(self, local_paths):
+        """Unpin files returned with `pin=True`, they may be evicted again."""
+        with self._lock:
+            self._pins.subtract(os.path.basename(path) for path in local_paths)
+            self._pins += Counter()  # drop zero counts
+            self._evict()
+
+    def _evict(self):
+        # oldest first, skipping files a scan is still reading
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if self._pins[key] > 0:
+                continue
+            size = self._entries.pop(key)
+            self._bytes -= size
+            try:
+                os.remove(self._local_path(key))
+            except FileNotFoundError:
+                pass
+            logging.info(f"file cache: evicted {key} ({size} bytes)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "files": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+delta_file_cache = LocalFileCache(DELTA_FILE_CACHE_DIR, DELTA_FILE_CACHE_MAX_BYTES)
+
+
+def _local_fragment(dataset, fragment, local_path):
+    return dataset.format.make_fragment(
+        local_path,
+        pafs.LocalFileSystem(),
+        partition_expression=fragment.partition_expression,
+    )
+
+
+@contextmanager
+def cached_files(dataset, fragments, sizes=None):
+    """
+    Dataset over `fragments` of a Delta pyarrow dataset, served from the local cache.
+
+    Every missing file is fetched into the cache first. The local copies
+    can't be evicted until the block exits, scan inside it.
+    """
+    sizes = sizes or {}
+    if not delta_file_cache.enabled:
+        yield ds.FileSystemDataset(
+            fragments, dataset.schema, dataset.format, dataset.filesystem
+        )
+        return
+
+    local, local_paths = [], []
+    try:
+        for fragment in fragments:
+            local_path = delta_file_cache.fetch(
+                dataset.filesystem, fragment.path, sizes.get(fragment.path), pin=True
+            )
+            local.append(_local_fragment(dataset, fragment, local_path))
+            local_paths.append(local_path)
+
+        yield ds.FileSystemDataset(
+            local, dataset.schema, dataset.format, pafs.LocalFileSystem()
+        )
+    finally:
+        delta_file_cache.release(local_paths)
@@ -0,0 +1,99 @@
+import os
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# length of the geohash prefix used as the sensor_data_by_geohash partition key
+# (precision 4 cells are ~39km x 20km at the equator)
+GEOHASH_PARTITION_PRECISION = int(os.getenv("GEOHASH_PARTITION_PRECISION", "4"))
+
+# full geohash length stored as the clustering column
+GEOHASH_PRECISION = 9
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash of (lat, lon), `precision` base32 characters long."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    value = 0
+    bits = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            value = 0
+            bits = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of `precision` characters."""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def _grid(min_lat, min_lon, max_lat, max_lon, precision):
+    height, width = cell_size(precision)
+    last_row = int(180.0 / height) - 1
+    last_col = int(360.0 / width) - 1
+    rows = range(
+        min(int((min_lat + 90.0) // height), last_row),
+        min(int((max_lat + 90.0) // height), last_row) + 1,
+    )
+    cols = range(
+        min(int((min_lon + 180.0) // width), last_col),
+        min(int((max_lon + 180.0) // width), last_col) + 1,
+    )
+    return height, width, rows, cols
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, precision=GEOHASH_PARTITION_PRECISION):
+    """
+    Geohash cells of `precision` characters covering the bounding box.
+
+    Walks the cell grid row by row from the south-west corner, so every cell
+    intersecting the box is returned exactly once.
+    """
+    height, width, rows, cols = _grid(min_lat, min_lon, max_lat, max_lon, precision)
+    return [
+        encode(-90.0 + (row + 0.5) * height, -180.0 + (col + 0.5) * width, precision)
+        for row in rows
+        for col in cols
+    ]
+
+
+def cover_size(min_lat, min_lon, max_lat, max_lon, precision=GEOHASH_PARTITION_PRECISION):
+    """Number of cells `cover` would return, without building them."""
+    _, _, rows, cols = _grid(min_lat, min_lon, max_lat, max_lon, precision)
+    return len(rows) * len(cols)
+
+
+def cover_precision(min_lat, min_lon, max_lat, max_lon, max_cells, precision=GEOHASH_PARTITION_PRECISION):
+    """
+    Finest precision, from `precision` up to GEOHASH_PRECISION, whose cover of
+    the box has at most `max_cells` cells.
+
+    Small boxes get small cells, so range reads skip most of each partition.
+    """
+    while precision < GEOHASH_PRECISION and cover_size(
+        min_lat, min_lon, max_lat, max_lon, precision + 1
+    ) <= max_cells:
+        precision += 1
+    return precision
+
+
+def prefix_range(cell):
+    """[low, high) bounds of the geohashes starting with `cell`."""
+    # "{" sorts right after "z", the last base32 character
+    return cell, cell + "{"
@@ -0,0 +1,131 @@
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from cassandra.concurrent import execute_concurrent_with_args
+
+from utils.cassandra_session import get_cassandra_session, prepared
+from utils.delta_snapshot import SnapshotSubscriber, sensor_data_filter
+from utils.geohash import GEOHASH_PARTITION_PRECISION, GEOHASH_PRECISION, encode
+
+GEOHASH_SYNC_ENABLED = os.getenv("GEOHASH_SYNC_ENABLED", "true").lower() == "true"
+
+# days re-upserted when the snapshot is (re)loaded, to cover readings ingested
+# while the app was down; older gaps are for jobs/backfill_sensor_geohash.py
+GEOHASH_RESYNC_DAYS = int(os.getenv("GEOHASH_RESYNC_DAYS", "2"))
+
+GEOHASH_COLUMNS = [
+    "device_id",
+    "timestamp",
+    "lat",
+    "lon",
+    "temp",
+    "humidity",
+    "country",
+    "state",
+    "postal_code",
+]
+
+INSERT_CQL = """
+INSERT INTO sensor_data_by_geohash (
+    geohash_prefix, day, geohash, timestamp, id,
+    lat, lon, temp, humidity, country, state, postal_code
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def reading_id(device_id, timestamp):
+    """
+    Stable row id of a reading.
+
+    The Delta rows carry no id, so one is derived from (device_id, timestamp):
+    writing the same reading again overwrites it instead of adding a copy.
+    """
+    return uuid.uuid5(uuid.NAMESPACE_OID, f"{device_id}/{timestamp.isoformat()}")
+
+
+def geohash_rows(table):
+    """Insert parameters for the typed sensor rows that have a position and a timestamp."""
+    rows = []
+    for device_id, timestamp, lat, lon, *values in zip(
+        *(table.column(name).to_pylist() for name in GEOHASH_COLUMNS)
+    ):
+        if lat is None or lon is None or timestamp is None:
+            continue
+        geohash = encode(lat, lon, GEOHASH_PRECISION)
+        rows.append(
+            (
+                geohash[:GEOHASH_PARTITION_PRECISION],
+                timestamp.date(),
+                geohash,
+                timestamp,
+                reading_id(device_id, timestamp),
+                lat,
+                lon,
+                *values,
+            )
+        )
+    return rows
+
+
+def write_geohash_rows(table, concurrency=64):
+    """
+    Upsert typed sensor rows into their (geohash_prefix, day) partitions.
+
+    Returns (written, failed). Row ids are derived from the reading, so rows
+    can be written again safely.
+    """
+    written = 0
+    failed = 0
+    for success, result in execute_concurrent_with_args(
+        get_cassandra_session(),
+        prepared(INSERT_CQL),
+        geohash_rows(table),
+        concurrency=concurrency,
+        raise_on_first_error=False,
+    ):
+        if success:
+            written += 1
+        else:
+            failed += 1
+            logging.error(f"geohash insert failed: {result}")
+    return written, failed
+
+
+class GeohashSync(SnapshotSubscriber):
+    """
+    Keeps sensor_data_by_geohash up to date with the sensor Delta table.
+
+    Subscribed to the snapshot by the delta tailer, like DeviceDaySync: the
+    rows added by every new version are upserted as they are applied. A
+    failed version is retried with the most recent days on the next catch-up.
+    """
+
+    name = "geohash sync"
+
+    def __init__(self):
+        self._stats = {"written": 0, "failed": 0}
+        super().__init__(None)
+
+    def _fold(self, version, add_actions, rows, rebuild):
+        if rebuild and rows.num_rows:
+            latest = pc.max(rows.column("date")).as_py()
+            if latest is not None:
+                since = latest - timedelta(days=GEOHASH_RESYNC_DAYS - 1)
+                rows = rows.filter(ds.field("date") >= since)
+        written, failed = write_geohash_rows(rows.filter(sensor_data_filter()))
+        self._stats["written"] += written
+        self._stats["failed"] += failed
+        if failed:
+            # the version isn't advanced, the snapshot replays the latest days
+            raise RuntimeError(f"{failed} geohash upserts failed at version {version}")
+        return {}
+
+    def stats(self):
+        return dict(self._stats)
+
+
+geohash_sync = GeohashSync()
@@ -0,0 +1,351 @@
+from datetime import date, datetime, timedelta, timezone
+
+import polars as pl
+
+from utils.delta_snapshot import SnapshotSubscriber, sensor_snapshot
+
+REGION_COLUMNS = ["country", "state", "postal_code"]
+
+REGIONAL_METRICS = ["temp", "humidity", "pressure"]
+
+REGIONAL_COLUMNS = ["timestamp", "device_id"] + REGION_COLUMNS + REGIONAL_METRICS
+
+# bucket name -> polars truncate interval, finest first
+REGIONAL_GRANULARITIES = {"hour": "1h", "day": "1d", "month": "1mo"}
+
+
+def _partial_aggregates(df: pl.DataFrame, every: str) -> pl.DataFrame:
+    """
+    Mergeable aggregates per region and bucket.
+
+    Sum and count (for means) plus min / max with the timestamp and device
+    that recorded them (for extremes).
+    """
+    aggs = [pl.len().alias("readings")]
+    for metric in REGIONAL_METRICS:
+        by_min = dict(by=metric, nulls_last=True)
+        by_max = dict(by=metric, descending=True, nulls_last=True)
+        aggs += [
+            pl.col(metric).sum().alias(f"{metric}_sum"),
+            pl.col(metric).count().alias(f"{metric}_count"),
+            pl.col(metric).min().alias(f"{metric}_min"),
+            pl.col("timestamp").sort_by(**by_min).first().alias(f"{metric}_min_ts"),
+            pl.col("device_id").sort_by(**by_min).first().alias(f"{metric}_min_device"),
+            pl.col(metric).max().alias(f"{metric}_max"),
+            pl.col("timestamp").sort_by(**by_max).first().alias(f"{metric}_max_ts"),
+            pl.col("device_id").sort_by(**by_max).first().alias(f"{metric}_max_device"),
+        ]
+    return (
+        df.with_columns(pl.col("timestamp").dt.truncate(every).alias("bucket"))
+        .group_by(REGION_COLUMNS + ["bucket"])
+        .agg(aggs)
+    )
+
+
+def _empty_aggregates(every: str) -> pl.DataFrame:
+    schema = {"timestamp": pl.Datetime("us"), "device_id": pl.String}
+    schema.update({column: pl.String for column in REGION_COLUMNS})
+    schema.update({metric: pl.Float64 for metric in REGIONAL_METRICS})
+    return _partial_aggregates(pl.DataFrame(schema=schema), every)
+
+
+def _combine(metrics=REGIONAL_METRICS):
+    """Aggregations folding partials together (sums add up, extremes keep the winner)."""
+    aggs = [pl.col("readings").sum()]
+    for metric in metrics:
+        by_min = dict(by=f"{metric}_min", nulls_last=True)
+        by_max = dict(by=f"{metric}_max", descending=True, nulls_last=True)
+        aggs += [
+            pl.col(f"{metric}_sum").sum(),
+            pl.col(f"{metric}_count").sum(),
+            pl.col(f"{metric}_min").min(),
+            pl.col(f"{metric}_min_ts").sort_by(**by_min).first(),
+            pl.col(f"{metric}_min_device").sort_by(**by_min).first(),
+            pl.col(f"{metric}_max").max(),
+            pl.col(f"{metric}_max_ts").sort_by(**by_max).first(),
+            pl.col(f"{metric}_max_device").sort_by(**by_max).first(),
+        ]
+    return aggs
+
+
+def _merge_aggregates(current: pl.DataFrame, partial: pl.DataFrame) -> pl.DataFrame:
+    """
+    Fold `partial` into `current`, both sorted by bucket.
+
+    Only the buckets from the earliest one in `partial` on are regrouped, the
+    older rows are carried over as they are. New readings land in the latest
+    buckets, so a fold costs the size of the update, not of the history.
+    """
+    if partial.height == 0:
+        return current
+    split = current["bucket"].search_sorted(partial["bucket"].min(), side="left")
+    merged = (
+        pl.concat([current.slice(split), partial], how="vertical_relaxed")
+        .group_by(REGION_COLUMNS + ["bucket"])
+        .agg(_combine())
+        .sort("bucket")
+    )
+    return pl.concat([current.slice(0, split), merged], how="vertical_relaxed")
+
+
+def _floor(moment: datetime, granularity: str) -> datetime:
+    if granularity == "month":
+        return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil(moment: datetime, granularity: str) -> datetime:
+    floor = _floor(moment, granularity)
+    if floor == moment:
+        return moment
+    if granularity == "month":
+        return (floor + timedelta(days=32)).replace(day=1)
+    return floor + (timedelta(days=1) if granularity == "day" else timedelta(hours=1))
+
+
+def bucket_cover(start: datetime, end: datetime, granularities=("month", "day", "hour")):
+    """
+    Split [start, end) into the fewest aligned buckets, coarsest first.
+
+    Returns (granularity, lo, hi) pieces: whole months in the middle, whole
+    days next to them and hours at the edges, i.e. O(log range) summaries.
+    Bounds are taken at the finest granularity.
+    """
+    coarsest, finer = granularities[0], granularities[1:]
+    if not finer:
+        lo, hi = _floor(start, coarsest), _ceil(end, coarsest)
+        return [(coarsest, lo, hi)] if lo < hi else []
+    lo, hi = _ceil(start, coarsest), _floor(end, coarsest)
+    if lo >= hi:
+        return bucket_cover(start, end, finer)
+    return (
+        bucket_cover(start, lo, finer)
+        + [(coarsest, lo, hi)]
+        + bucket_cover(hi, end, finer)
+    )
+
+
+def _as_datetime(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """Readings are naive UTC: convert an aware datetime (e.g. `...Z`) to that, keep naive ones."""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class RegionalRollups(SnapshotSubscriber):
+    """
+    Hourly, daily and monthly sensor aggregates per country / state / postal code.
+
+    Kept as sums / counts and min / max with their timestamp and device, so
+    means and extremes over any set of regions and time range are combined
+    from a few bucket summaries. Updated incrementally like the dashboard
+    rollups from the rows the snapshot read for each new version.
+    """
+
+    name = "regional rollups"
+    columns = REGIONAL_COLUMNS
+
+    def __init__(self, snapshot):
+        self._aggregates = self._empty()
+        # (version, earliest hour touched) of recent updates, see changed_since
+        self._changes = []
+        self._changes_complete_from = -1
+        super().__init__(snapshot)
+
+    @staticmethod
+    def _empty():
+        return {name: _empty_aggregates(every) for name, every in REGIONAL_GRANULARITIES.items()}
+
+    def _fold(self, version, add_actions, rows, rebuild):
+        aggregates = self._empty() if rebuild else dict(self._aggregates)
+        if rows.height:
+            for name, every in REGIONAL_GRANULARITIES.items():
+                aggregates[name] = _merge_aggregates(
+                    aggregates[name], _partial_aggregates(rows, every)
+                )
+        changes = [] if rebuild else list(self._changes)
+        complete_from = version if rebuild else self._changes_complete_from
+        if rows.height and not rebuild:
+            changes.append((version, _floor(rows["timestamp"].min(), "hour")))
+            if len(changes) > 1000:
+                complete_from = changes.pop(0)[0]
+        return {
+            "_aggregates": aggregates,
+            "_changes": changes,
+            "_changes_complete_from": complete_from,
+        }
+
+    def ingest(self, rows: pl.DataFrame, version):
+        """Fold already-read sensor rows in as `version` (backfills, benchmarks)."""
+        self._update(version, None, rows)
+
+    def last_hour(self) -> datetime:
+        """Latest hourly bucket held, without refreshing."""
+        with self._lock:
+            hourly = self._aggregates["hour"]
+        return hourly["bucket"][-1] if hourly.height else None
+
+    def changed_since(self, version):
+        """
+        Earliest hour whose aggregates changed after `version`, None if nothing did.
+
+        Returns datetime.min when that is no longer known (rebuild, old version).
+        """
+        with self._lock:
+            if version < self._changes_complete_from:
+                return datetime.min
+            changed = [hour for v, hour in self._changes if v > version]
+        return min(changed) if changed else None
+
+    def hourly_series(self, metric, country=None, state=None, postal_code=None, start=None):
+        """
+        Hourly mean of `metric` for the matching regions, from `start` on.
+
+        The hourly aggregates are kept sorted by bucket, so the start is found
+        by binary search and only the rows after it are touched.
+        """
+        with self._lock:
+            hourly = self._aggregates["hour"]
+        if start is not None:
+            hourly = hourly.slice(hourly["bucket"].search_sorted(start, side="left"))
+        for column, value in zip(REGION_COLUMNS, [country, state, postal_code]):
+            if value is not None:
+                hourly = hourly.filter(pl.col(column) == value)
+        return (
+            hourly.group_by("bucket")
+            .agg(pl.col(f"{metric}_sum").sum(), pl.col(f"{metric}_count").sum())
+            .select(
+                "bucket",
+                (pl.col(f"{metric}_sum") / pl.col(f"{metric}_count")).alias("value"),
+            )
+            .drop_nulls("value")
+            .sort("bucket")
+        )
+
+    def latest_date(self) -> date:
+        self.refresh()
+        daily = self._aggregates["day"]
+        return daily["bucket"].max().date() if daily.height else None
+
+    def _partials(self, start: datetime, end: datetime, region, granularities) -> pl.LazyFrame:
+        """Bucket summaries covering [start, end) for the matching regions."""
+        with self._lock:
+            aggregates = dict(self._aggregates)
+        pieces = [
+            aggregates[granularity]
+            .lazy()
+            .filter(pl.col("bucket").is_between(lo, hi, closed="left"))
+            for granularity, lo, hi in bucket_cover(start, end, granularities)
+        ]
+        if not pieces:
+            pieces = [aggregates[granularities[-1]].lazy().clear()]
+        partials = pl.concat(pieces, how="vertical_relaxed")
+        for column, value in zip(REGION_COLUMNS, region):
+            if value is not None:
+                partials = partials.filter(pl.col(column) == value)
+        return partials
+
+    def _default_range(self, start_date: date, end_date: date):
+        """[start, end) for inclusive dates, the last 7 days of data by default."""
+        if end_date is None:
+            latest = self.latest_date()
+            end_date = latest if latest is not None else date.today()
+        if start_date is None:
+            start_date = end_date - timedelta(days=6)
+        return _as_datetime(start_date), _as_datetime(end_date + timedelta(days=1))
+
+    def averages(
+        self,
+        country: str = None,
+        state: str = None,
+        postal_code: str = None,
+        aggregation: str = "daily",
+        start_date: date = None,
+        end_date: date = None,
+    ) -> pl.DataFrame:
+        """
+        Mean temp / humidity / pressure for the matching regions in [start_date, end_date].
+
+        `aggregation` is "daily", "monthly" or "total". Without dates the last
+        7 days of data are used.
+        """
+        self.refresh()
+        start, end = self._default_range(start_date, end_date)
+        region = (country, state, postal_code)
+        if aggregation == "daily":
+            partials = self._partials(start, end, region, ("day",))
+            keys = [pl.col("bucket").dt.date().alias("day")]
+        else:
+            partials = self._partials(start, end, region, ("month", "day"))
+            keys = (
+                [pl.col("bucket").dt.month_start().dt.date().alias("month")]
+                if aggregation == "monthly"
+                else []
+            )
+
+        sums = [pl.col("readings").sum()]
+        for metric in REGIONAL_METRICS:
+            sums += [pl.col(f"{metric}_sum").sum(), pl.col(f"{metric}_count").sum()]
+        grouped = partials.group_by(keys).agg(sums) if keys else partials.select(sums)
+        means = [
+            (pl.col(f"{metric}_sum") / pl.col(f"{metric}_count")).round(2).alias(metric)
+            for metric in REGIONAL_METRICS
+        ]
+        result = grouped.select(
+            *[key.meta.output_name() for key in keys], *means, pl.col("readings")
+        )
+        if keys:
+            result = result.sort(keys[0].meta.output_name())
+        return result.collect()
+
+    def extremes(
+        self,
+        metric: str,
+        country: str = None,
+        state: str = None,
+        postal_code: str = None,
+        start: datetime = None,
+        end: datetime = None,
+    ) -> dict:
+        """
+        Min and max of `metric` with the timestamp and device that recorded them.
+
+        The range [start, end) is answered at hour resolution from the
+        month / day / hour summaries. Without a range the last 7 days of data
+        are used. Aware bounds are converted to naive UTC.
+        """
+        self.refresh()
+        default_start, default_end = self._default_range(None, None)
+        start = naive_utc(start) or default_start
+        end = naive_utc(end) or default_end
+        combined = (
+            self._partials(start, end, (country, state, postal_code), ("month", "day", "hour"))
+            .select(_combine([metric]))
+            .collect()
+            .row(0, named=True)
+        )
+        return {
+            "metric": metric,
+            "start": start,
+            "end": end,
+            "readings": combined["readings"],
+            "min": {
+                "value": combined[f"{metric}_min"],
+                "timestamp": combined[f"{metric}_min_ts"],
+                "device_id": combined[f"{metric}_min_device"],
+            },
+            "max": {
+                "value": combined[f"{metric}_max"],
+                "timestamp": combined[f"{metric}_max_ts"],
+                "device_id": combined[f"{metric}_max_device"],
+            },
+        }
+
+
+regional_rollups = RegionalRollups(sensor_snapshot)
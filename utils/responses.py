@@ -0,0 +1,93 @@
+import io
+
+import orjson
+import polars as pl
+import pyarrow as pa
+from fastapi import Request, Response
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def wants_arrow(request: Request) -> bool:
+    return ARROW_STREAM_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _arrow_stream(table: pa.Table, extra: dict) -> bytes:
+    if extra:
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"meta"] = orjson.dumps(extra)
+        table = table.replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _iso_datetimes(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Format Datetime columns the way `datetime.isoformat()` does.
+
+    `write_json` would write "2025-01-01 05:00:00"; clients get the ISO 8601
+    "2025-01-01T05:00:00" (".123000" only when there are microseconds).
+    """
+    columns = []
+    for name, dtype in df.schema.items():
+        if not isinstance(dtype, pl.Datetime):
+            continue
+        zone = "%:z" if dtype.time_zone else ""
+        col = pl.col(name)
+        columns.append(
+            pl.when(col.dt.microsecond() == 0)
+            .then(col.dt.strftime(f"%Y-%m-%dT%H:%M:%S{zone}"))
+            .otherwise(col.dt.strftime(f"%Y-%m-%dT%H:%M:%S%.6f{zone}"))
+            .alias(name)
+        )
+    return df.with_columns(columns) if columns else df
+
+
+def _json_envelope(frames: dict, extra: dict) -> bytes:
+    # polars writes the row objects natively, only the small envelope goes through orjson
+    parts = []
+    for key, df in frames.items():
+        rows = io.BytesIO()
+        _iso_datetimes(df).write_json(rows)
+        parts.append(orjson.dumps(key) + b":" + rows.getvalue())
+    for name, value in extra.items():
+        parts.append(orjson.dumps(name) + b":" + orjson.dumps(value, default=str))
+    return b"{" + b",".join(parts) + b"}"
+
+
+def frame_response(request: Request, frame, key: str, **extra) -> Response:
+    """
+    Return a Polars DataFrame / Arrow table as `{key: [rows...], **extra}` JSON bytes.
+
+    Rows are serialized straight from the columnar buffers, no per-row dicts.
+    Clients sending `Accept: application/vnd.apache.arrow.stream` get an Arrow
+    IPC stream instead, with `extra` stored as JSON in the schema metadata.
+    """
+    if frame is None:
+        frame = pl.DataFrame()
+    if wants_arrow(request):
+        table = (
+            frame
+            if isinstance(frame, pa.Table)
+            else frame.to_arrow(compat_level=pl.CompatLevel.oldest())
+        )
+        return Response(
+            content=_arrow_stream(table, extra), media_type=ARROW_STREAM_MEDIA_TYPE
+        )
+    df = pl.from_arrow(frame) if isinstance(frame, pa.Table) else frame
+    return Response(
+        content=_json_envelope({key: df}, extra), media_type="application/json"
+    )
+
+
+def frames_response(frames: dict, **extra) -> Response:
+    """
+    Return several Polars DataFrames as one `{name: [rows...], ..., **extra}` JSON body.
+
+    JSON only: an Arrow IPC stream carries a single schema.
+    """
+    return Response(
+        content=_json_envelope(frames, extra), media_type="application/json"
+    )
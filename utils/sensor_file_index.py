@@ -0,0 +1,157 @@
+from datetime import date
+
+from utils.delta_snapshot import (
+    SnapshotSubscriber,
+    file_sizes,
+    read_sensor_files,
+    sensor_data_filter,
+    sensor_snapshot,
+)
+
+
+def _stat_column(add_actions, name, length):
+    # writers that skip statistics leave the column out entirely
+    if name in add_actions.column_names:
+        return add_actions.column(name).to_pylist()
+    return [None] * length
+
+
+def file_stats(add_actions) -> dict:
+    """
+    Data file path -> timestamp min / max, row count and postal code stats.
+
+    Read from the statistics in the Delta add actions, no parquet file is
+    opened. `timestamp` stats are the 'YYYY-MM-DD HH:MM:SS.f' strings, which
+    sort the same as the timestamps.
+    """
+    paths = add_actions.column("path").to_pylist()
+    columns = {
+        name: _stat_column(add_actions, name, len(paths))
+        for name in [
+            "num_records",
+            "min.timestamp",
+            "max.timestamp",
+            "null_count.postal_code",
+            "min.postal_code",
+            "max.postal_code",
+        ]
+    }
+    files = {}
+    for i, path in enumerate(paths):
+        num_records = columns["num_records"][i]
+        postal_nulls = columns["null_count.postal_code"][i]
+        files[path] = {
+            "min_ts": columns["min.timestamp"][i],
+            "max_ts": columns["max.timestamp"][i],
+            "num_records": num_records,
+            "postal_null_ratio": (
+                postal_nulls / num_records
+                if num_records and postal_nulls is not None
+                else None
+            ),
+            "only_invalid_postal": (
+                columns["min.postal_code"][i] == "00000"
+                and columns["max.postal_code"][i] == "00000"
+            ),
+        }
+    return files
+
+
+def _has_valid_rows(entry):
+    # null postal codes fail the `!= "00000"` filter as well
+    return not (
+        entry["num_records"] == 0
+        or entry["postal_null_ratio"] == 1
+        or entry["only_invalid_postal"]
+    )
+
+
+def files_overlapping(files: dict, start_date: date = None, end_date: date = None):
+    """Paths in `files` (file_stats) that may hold valid readings in [start_date, end_date)."""
+    start = start_date.isoformat() if start_date is not None else None
+    end = end_date.isoformat() if end_date is not None else None
+    return [
+        path
+        for path, entry in files.items()
+        if _has_valid_rows(entry)
+        and (start is None or entry["max_ts"] is None or entry["max_ts"] >= start)
+        and (end is None or entry["min_ts"] is None or entry["min_ts"] < end)
+    ]
+
+
+def read_sensor_range(start_date: date = None, end_date: date = None, columns=None, files_per_batch=8):
+    """
+    Valid readings with start_date <= timestamp < end_date, read a few files at a time.
+
+    Everything is pushed down to the scan of the latest table version: files
+    are picked from their add action stats, and the row filter and column
+    projection go to the parquet reader, which skips row groups on their
+    statistics. The in-memory snapshot is not loaded. Yields (files read,
+    files in range, typed table).
+    """
+    _, add_actions, dataset = sensor_snapshot.file_state()
+    sizes = file_sizes(add_actions)
+    paths = files_overlapping(file_stats(add_actions), start_date, end_date)
+    for i in range(0, len(paths), files_per_batch):
+        batch = paths[i : i + files_per_batch]
+        table = read_sensor_files(
+            dataset,
+            batch,
+            columns=columns,
+            filter=sensor_data_filter(start_date, end_date),
+            sizes=sizes,
+        )
+        yield i + len(batch), len(paths), table
+
+
+class SensorFileIndex(SnapshotSubscriber):
+    """
+    Per data file stats (see file_stats) of the latest snapshot version.
+
+    Kept up to date incrementally from the add actions: entries for added
+    files are created, entries for removed files dropped.
+    """
+
+    name = "sensor file index"
+
+    def __init__(self, snapshot):
+        self._files = {}
+        super().__init__(snapshot)
+
+    def _fold(self, version, add_actions, rows, rebuild):
+        # only the add actions are used, no rows
+        current = file_stats(add_actions)
+        files = {} if rebuild else dict(self._files)
+        for path in files.keys() - current.keys():
+            del files[path]
+        for path, entry in current.items():
+            files.setdefault(path, entry)
+        return {"_files": files}
+
+    def latest_date(self) -> date:
+        """
+        Most recent reading date, from the file statistics alone.
+
+        Files holding only invalid postal codes are skipped; within a mixed
+        file the max timestamp may belong to an invalid row.
+        """
+        self.refresh()
+        with self._lock:
+            latest = max(
+                (
+                    entry["max_ts"]
+                    for entry in self._files.values()
+                    if entry["max_ts"] is not None and _has_valid_rows(entry)
+                ),
+                default=None,
+            )
+        return None if latest is None else date.fromisoformat(latest[:10])
+
+    def overlapping_files(self, start_date: date = None, end_date: date = None):
+        """Files that may hold valid readings with start_date <= timestamp < end_date."""
+        self.refresh()
+        with self._lock:
+            return files_overlapping(self._files, start_date, end_date)
+
+
+sensor_file_index = SensorFileIndex(sensor_snapshot)
@@ -0,0 +1,162 @@
+import heapq
+import math
+
+import numpy as np
+import polars as pl
+
+from utils.delta_snapshot import SnapshotSubscriber, sensor_snapshot
+
+EARTH_RADIUS_KM = 6371.0088
+
+LOCATION_COLUMNS = ["device_id", "lat", "lon", "country", "state", "city", "postal_code"]
+
+# points per KD-tree leaf, scanned with one vectorized distance computation
+_LEAF_SIZE = 32
+
+
+def unit_vectors(lat, lon) -> np.ndarray:
+    """(n, 3) points on the unit sphere for latitudes / longitudes in degrees."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(squared_chord) -> np.ndarray:
+    """Great-circle distance in km for squared chord lengths between unit vectors."""
+    chord = np.sqrt(np.asarray(squared_chord, dtype=np.float64))
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+def km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+class KDTree:
+    """
+    Static KD-tree over unit-sphere points.
+
+    Straight-line (chord) distance between unit vectors grows monotonically
+    with great-circle distance, so nearest by chord is nearest by haversine
+    without any trigonometry at query time. Nodes split on the widest axis at
+    the median; leaves of up to _LEAF_SIZE points are scanned in one NumPy
+    expression.
+    """
+
+    def __init__(self, points: np.ndarray):
+        self.points = points
+        self.order = np.arange(len(points))
+        # node: (start, end, axis, split, left, right); axis -1 for leaves
+        self.nodes = []
+        if len(points):
+            self._build(0, len(points))
+
+    def _build(self, start, end):
+        node = len(self.nodes)
+        self.nodes.append(None)
+        if end - start <= _LEAF_SIZE:
+            self.nodes[node] = (start, end, -1, 0.0, -1, -1)
+            return node
+        block = self.points[self.order[start:end]]
+        axis = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+        middle = (end - start) // 2
+        partition = np.argpartition(block[:, axis], middle)
+        self.order[start:end] = self.order[start:end][partition]
+        split = float(self.points[self.order[start + middle], axis])
+        left = self._build(start, start + middle)
+        right = self._build(start + middle, end)
+        self.nodes[node] = (start, end, axis, split, left, right)
+        return node
+
+    def query(self, point: np.ndarray, k: int, max_squared_chord=math.inf):
+        """(indices, squared chord distances) of the `k` nearest points, nearest first."""
+        if not self.nodes:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # max-heap of the best candidates so far, as (-distance, index)
+        best = []
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            worst = -best[0][0] if len(best) == k else max_squared_chord
+            if bound > worst:
+                continue
+            start, end, axis, split, left, right = self.nodes[node]
+            if axis < 0:
+                indices = self.order[start:end]
+                distances = ((self.points[indices] - point) ** 2).sum(axis=1)
+                for distance, index in zip(distances.tolist(), indices.tolist()):
+                    if distance > max_squared_chord:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+                continue
+            offset = point[axis] - split
+            near, far = (left, right) if offset < 0 else (right, left)
+            # far side first on the stack so the near side is searched first
+            stack.append((far, max(bound, offset * offset)))
+            stack.append((near, bound))
+        best.sort(reverse=True)
+        return (
+            np.array([index for _, index in best], dtype=np.int64),
+            np.array([-distance for distance, _ in best]),
+        )
+
+
+class SensorLocationIndex(SnapshotSubscriber):
+    """
+    Latest known location of every device, with a KD-tree for nearest lookups.
+
+    Updated incrementally like the rollups: the rows the snapshot read for a
+    new version are folded in, and a device's location is replaced when a
+    newer reading comes in. The tree is rebuilt from the per-device table,
+    which is far smaller than the readings.
+    """
+
+    name = "sensor locations"
+    columns = ["timestamp"] + LOCATION_COLUMNS
+
+    def __init__(self, snapshot):
+        self._locations = None
+        self._tree = KDTree(np.empty((0, 3)))
+        super().__init__(snapshot)
+
+    def _fold(self, version, add_actions, rows, rebuild):
+        rows = rows.filter(pl.col("lat").is_not_null() & pl.col("lon").is_not_null())
+        if rows.height == 0:
+            return {"_locations": None, "_tree": KDTree(np.empty((0, 3)))} if rebuild else {}
+        if not rebuild and self._locations is not None:
+            rows = pl.concat([self._locations, rows], how="diagonal_relaxed")
+        # newest reading per device wins; readings without a timestamp sort first
+        locations = (
+            rows.sort("timestamp", nulls_last=False)
+            .unique("device_id", keep="last", maintain_order=True)
+            .sort("device_id")
+        )
+        return {
+            "_locations": locations,
+            "_tree": KDTree(unit_vectors(locations["lat"], locations["lon"])),
+        }
+
+    def nearest(self, lat: float, lon: float, k: int = 5, max_km: float = None) -> pl.DataFrame:
+        """
+        The `k` devices closest to (lat, lon), nearest first, with `distance_km`.
+
+        Only devices within `max_km` are returned when it's set.
+        """
+        self.refresh()
+        with self._lock:
+            tree, locations = self._tree, self._locations
+        if locations is None:
+            return pl.DataFrame(schema={"device_id": pl.String, "distance_km": pl.Float64})
+        max_squared_chord = math.inf if max_km is None else km_to_chord(max_km) ** 2
+        indices, distances = tree.query(unit_vectors(lat, lon)[0], k, max_squared_chord)
+        return (
+            locations[indices]
+            .select(LOCATION_COLUMNS + ["timestamp"])
+            .with_columns(distance_km=pl.Series(chord_to_km(distances)))
+        )
+
+
+sensor_locations = SensorLocationIndex(sensor_snapshot)
@@ -0,0 +1,142 @@
+from datetime import date, datetime, timedelta
+
+import polars as pl
+
+from utils.delta_snapshot import SnapshotSubscriber, sensor_snapshot
+
+ROLLUP_METRICS = ["temp", "humidity", "pressure"]
+
+# bucket name -> polars truncate interval
+ROLLUP_GRANULARITIES = {"hour": "1h", "day": "1d"}
+
+
+def _partial_rollup(df: pl.DataFrame, every: str) -> pl.DataFrame:
+    """
+    Mergeable per-bucket aggregates: first reading (by timestamp), sum, count, min, max.
+
+    Means are derived as sum / count when reading so partials from
+    different files can be combined without touching raw rows again.
+    """
+    aggs = [pl.col("timestamp").first().alias("first_ts")]
+    for metric in ROLLUP_METRICS:
+        aggs += [
+            pl.col(metric).first().alias(f"{metric}_first"),
+            pl.col(metric).sum().alias(f"{metric}_sum"),
+            pl.col(metric).count().alias(f"{metric}_count"),
+            pl.col(metric).min().alias(f"{metric}_min"),
+            pl.col(metric).max().alias(f"{metric}_max"),
+        ]
+    return (
+        df.sort("timestamp")
+        .with_columns(pl.col("timestamp").dt.truncate(every).alias("bucket"))
+        .group_by("bucket")
+        .agg(aggs)
+    )
+
+
+def _empty_rollup(every: str) -> pl.DataFrame:
+    schema = {"timestamp": pl.Datetime("us")}
+    schema.update({metric: pl.Float64 for metric in ROLLUP_METRICS})
+    return _partial_rollup(pl.DataFrame(schema=schema), every)
+
+
+def _merge_rollup(current: pl.DataFrame, partial: pl.DataFrame) -> pl.DataFrame:
+    aggs = [pl.col("first_ts").first()]
+    for metric in ROLLUP_METRICS:
+        aggs += [
+            pl.col(f"{metric}_first").first(),
+            pl.col(f"{metric}_sum").sum(),
+            pl.col(f"{metric}_count").sum(),
+            pl.col(f"{metric}_min").min(),
+            pl.col(f"{metric}_max").max(),
+        ]
+    return (
+        pl.concat([current, partial], how="vertical_relaxed")
+        .sort("first_ts")
+        .group_by("bucket")
+        .agg(aggs)
+        .sort("bucket")
+    )
+
+
+def _finalize_rollup(rollup: pl.DataFrame) -> pl.DataFrame:
+    columns = [pl.col("bucket")]
+    for metric in ROLLUP_METRICS:
+        columns += [
+            pl.col(f"{metric}_first"),
+            (pl.col(f"{metric}_sum") / pl.col(f"{metric}_count")).alias(f"{metric}_mean"),
+            pl.col(f"{metric}_min"),
+            pl.col(f"{metric}_max"),
+            pl.col(f"{metric}_count"),
+        ]
+    return rollup.select(columns)
+
+
+class SensorRollups(SnapshotSubscriber):
+    """
+    Hourly and daily aggregates of the sensor Delta table, maintained incrementally.
+
+    On every new table version the rows the snapshot read from the added
+    parquet files are folded into the existing rollups. If files disappeared
+    (optimize / overwrite) the rollups are rebuilt from the whole snapshot.
+    """
+
+    name = "sensor rollups"
+    columns = ["timestamp"] + ROLLUP_METRICS
+
+    def __init__(self, snapshot):
+        self._rollups = self._empty_rollups()
+        super().__init__(snapshot)
+
+    @staticmethod
+    def _empty_rollups():
+        return {name: _empty_rollup(every) for name, every in ROLLUP_GRANULARITIES.items()}
+
+    def _fold(self, version, add_actions, rows, rebuild):
+        rollups = self._empty_rollups() if rebuild else dict(self._rollups)
+        if rows.height:
+            for name, every in ROLLUP_GRANULARITIES.items():
+                rollups[name] = _merge_rollup(rollups[name], _partial_rollup(rows, every))
+        return {"_rollups": rollups}
+
+    def rollup(self, granularity, start_date: date = None, end_date: date = None):
+        """Finalized rollup rows with start_date <= bucket < end_date."""
+        self.refresh()
+        rollup = self._rollups[granularity]
+        if start_date is not None:
+            rollup = rollup.filter(
+                pl.col("bucket") >= datetime.combine(start_date, datetime.min.time())
+            )
+        if end_date is not None:
+            rollup = rollup.filter(
+                pl.col("bucket") < datetime.combine(end_date, datetime.min.time())
+            )
+        return _finalize_rollup(rollup)
+
+    def lazy_rollups(self):
+        """Finalized hourly and daily rollups as lazy frames, both from the same version."""
+        self.refresh()
+        with self._lock:
+            rollups = dict(self._rollups)
+        return {name: _finalize_rollup(df.lazy()) for name, df in rollups.items()}
+
+    def latest_date(self):
+        self.refresh()
+        daily = self._rollups["day"]
+        if daily.height == 0:
+            return None
+        return daily["bucket"].max().date()
+
+
+sensor_rollups = SensorRollups(sensor_snapshot)
+
+
+def hourly_rollup(day: date) -> pl.DataFrame:
+    """The (at most) 24 hourly rollup rows for `day`."""
+    if day is None:
+        return sensor_rollups.rollup("hour").clear()
+    return sensor_rollups.rollup("hour", day, day + timedelta(days=1))
+
+
+def daily_rollup(start_date: date = None, end_date: date = None) -> pl.DataFrame:
+    return sensor_rollups.rollup("day", start_date, end_date)
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import polars as pl
+
+from utils.regional_rollups import regional_rollups
+
+# how far back scored hours are kept per series, bounds `days` on the endpoint
+TREND_RETENTION = timedelta(days=90)
+# longest rolling window: a longer one would reach past the retained hours
+TREND_MAX_WINDOW = TREND_RETENTION
+# scored (region, metric, window) series kept, least recently used dropped first
+TREND_CACHE_MAX_SERIES = int(os.getenv("TREND_CACHE_MAX_SERIES", "256"))
+
+_WINDOW = re.compile(r"^([1-9]\d*)([hd])$")
+
+
+def parse_window(window: str) -> timedelta:
+    """'30d' / '12h' -> timedelta, at most TREND_MAX_WINDOW."""
+    match = _WINDOW.match(window)
+    if not match:
+        raise ValueError(f"Invalid window {window!r}, expected e.g. '30d' or '12h'")
+    amount, unit = int(match.group(1)), match.group(2)
+    span = timedelta(days=amount) if unit == "d" else timedelta(hours=amount)
+    if span > TREND_MAX_WINDOW:
+        raise ValueError(f"Window {window!r} exceeds {TREND_MAX_WINDOW.days}d")
+    return span
+
+
+def score_series(series: pl.DataFrame, window: str) -> pl.DataFrame:
+    """Rolling mean / std over `window` by bucket, and the Z-score of each hour against them."""
+    return series.with_columns(
+        pl.col("value").rolling_mean_by("bucket", window_size=window).alias("rolling_mean"),
+        pl.col("value").rolling_std_by("bucket", window_size=window).alias("rolling_std"),
+    ).with_columns(
+        ((pl.col("value") - pl.col("rolling_mean")) / pl.col("rolling_std")).alias("zscore")
+    )
+
+
+class SensorTrends:
+    """
+    Rolling statistics of hourly regional series, updated incrementally.
+
+    Works on whatever the rollups hold, refresh them first (the delta tailer
+    does that in the background).
+
+    Scored hours are cached per (region, metric, window), for the
+    TREND_CACHE_MAX_SERIES most recently used series. When the rollups
+    move on, only hours from the earliest changed one are rescored, reading
+    one window of history before them, so appending new hours costs the same
+    however long the history is.
+    """
+
+    def __init__(self, rollups):
+        self.rollups = rollups
+        self._lock = threading.Lock()
+        self._series = OrderedDict()  # key -> (rollups version, scored frame), oldest first
+
+    def _update(self, key, metric, region, window):
+        span = parse_window(window)
+        version = self.rollups.version()
+        with self._lock:
+            cached_version, scored = self._series.get(key, (None, None))
+            if scored is not None:
+                self._series.move_to_end(key)
+        if cached_version == version:
+            return scored
+
+        changed = None if scored is None else self.rollups.changed_since(cached_version)
+        if scored is not None and changed is None:
+            fresh = scored
+        else:
+            if scored is None or changed == datetime.min:
+                latest = self.rollups.last_hour()
+                if latest is None:
+                    return None
+                changed = latest - TREND_RETENTION
+                scored = None
+            history = self.rollups.hourly_series(metric, *region, start=changed - span)
+            rescored = score_series(history, window).filter(pl.col("bucket") >= changed)
+            if scored is None:
+                fresh = rescored
+            else:
+                fresh = pl.concat([scored.filter(pl.col("bucket") < changed), rescored])
+            if fresh.height:
+                cutoff = fresh["bucket"].max() - TREND_RETENTION
+                fresh = fresh.filter(pl.col("bucket") >= cutoff)
+
+        with self._lock:
+            self._series[key] = (version, fresh)
+            self._series.move_to_end(key)
+            while len(self._series) > TREND_CACHE_MAX_SERIES:
+                self._series.popitem(last=False)
+        return fresh
+
+    def trends(
+        self,
+        metric,
+        country=None,
+        state=None,
+        postal_code=None,
+        window="30d",
+        days=7,
+        threshold=3.0,
+    ) -> pl.DataFrame:
+        """Last `days` of hourly values with rolling mean / std, Z-score and anomaly flag."""
+        region = (country, state, postal_code)
+        scored = self._update((metric, region, window), metric, region, window)
+        if scored is None or scored.height == 0:
+            return pl.DataFrame(
+                schema={
+                    "bucket": pl.Datetime("us"),
+                    "value": pl.Float64,
+                    "rolling_mean": pl.Float64,
+                    "rolling_std": pl.Float64,
+                    "zscore": pl.Float64,
+                    "anomaly": pl.Boolean,
+                }
+            )
+        since = scored["bucket"].max() - timedelta(days=days)
+        return scored.filter(pl.col("bucket") > since).with_columns(
+            (pl.col("zscore").abs() >= threshold).fill_null(False).alias("anomaly")
+        )
+
+
+sensor_trends = SensorTrends(regional_rollups)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+import orjson
+
+from utils.executor import run_blocking
+
+# key -> task of the computation currently running for that key
+_inflight = {}
+_stats = {"started": 0, "coalesced": 0, "in_flight": 0}
+
+
+def flight_key(endpoint, **params):
+    """
+    Normalized key for `endpoint` called with `params`.
+
+    Parameter order doesn't matter and None values are dropped, so
+    `?date=` and a missing date coalesce. Never pass credentials here.
+    """
+    normalized = {name: value for name, value in params.items() if value is not None}
+    return endpoint + "?" + orjson.dumps(
+        normalized, option=orjson.OPT_SORT_KEYS, default=str
+    ).decode()
+
+
+def _forget(key, task):
+    # mark the exception retrieved, every waiter may have been cancelled already
+    if not task.cancelled():
+        task.exception()
+    if _inflight.get(key) is task:
+        del _inflight[key]
+        _stats["in_flight"] -= 1
+
+
+async def coalesce(key, fn, *args, **kwargs):
+    """
+    Await `fn(*args, **kwargs)`, sharing one in-flight run between identical keys.
+
+    The first caller for `key` starts the computation, concurrent callers with
+    the same key wait on it and get the same result (or exception). Nothing is
+    cached once it finishes, the next call starts a fresh run. A waiter being
+    cancelled (client went away) doesn't cancel the shared computation.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        _inflight[key] = task
+        _stats["started"] += 1
+        _stats["in_flight"] += 1
+        task.add_done_callback(lambda done: _forget(key, done))
+    else:
+        _stats["coalesced"] += 1
+        logging.debug(f"singleflight: joining in-flight {key}")
+    return await asyncio.shield(task)
+
+
+def singleflight_stats():
+    """How many computations were started vs. served from an in-flight one."""
+    return dict(_stats)
+
+
+async def run_blocking_once(backend, fn, *args, **kwargs):
+    """
+    `run_blocking`, but identical concurrent calls share one run.
+
+    Keyed on the function and its arguments, so only use it for calls whose
+    arguments fully determine the result (and contain no credentials).
+    """
+    key = flight_key(f"{fn.__module__}.{fn.__qualname__}", args=args, **kwargs)
+    return await coalesce(key, run_blocking, backend, fn, *args, **kwargs)